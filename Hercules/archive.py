@@ -0,0 +1,113 @@
+import posixpath
+import zlib
+from typing import BinaryIO, List, Tuple, Union
+from zipfile import BadZipFile, ZIP_DEFLATED, ZipFile
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveLimits:
+    """Limits applied while extracting an uploaded archive, to defuse zip bombs."""
+
+    def __init__(self, max_entries: int = 200, max_entry_size: int = 1024 * 1024 * 5,
+                 max_total_size: int = 1024 * 1024 * 50, max_ratio: int = 100):
+        self.max_entries = max_entries
+        self.max_entry_size = max_entry_size
+        self.max_total_size = max_total_size
+        self.max_ratio = max_ratio
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _safe_name(name: str) -> str:
+    normalized = posixpath.normpath(name.replace('\\', '/'))
+    if normalized.startswith(('/', '../')) or normalized == '..' or ':' in normalized.split('/')[0]:
+        raise ArchiveError(f"Unsafe path in archive: {name}")
+    return normalized
+
+
+def extract_lua_files(zip_path: Union[str, BinaryIO], limits: ArchiveLimits = None) -> Tuple[List[Tuple[str, bytes]], List[Tuple[str, str]]]:
+    """Read every `.lua` entry of the archive (a path or a binary file object), streaming each one so the real
+    size is enforced.
+
+    Returns the extracted `(name, data)` pairs and `(name, reason)` pairs for skipped entries.
+    Raises ArchiveError if the archive as a whole is unusable.
+    """
+    limits = limits or ArchiveLimits()
+    files = []
+    skipped = []
+    seen = set()
+    total = 0
+
+    try:
+        archive = ZipFile(zip_path)
+    except (BadZipFile, OSError) as e:
+        raise ArchiveError(f"Not a valid ZIP archive: {e}")
+
+    with archive:
+        entries = [info for info in archive.infolist() if not info.is_dir()]
+        if len(entries) > limits.max_entries:
+            raise ArchiveError(f"Too many files in archive. (Max: {limits.max_entries})")
+
+        for info in entries:
+            name = _safe_name(info.filename)
+            if name in seen:
+                # `a/./b.lua` and `a\b.lua` normalize to `a/b.lua`, only the first one is kept.
+                skipped.append((info.filename, f"Duplicate of {name}."))
+                continue
+            seen.add(name)
+            if not name.endswith('.lua'):
+                skipped.append((name, "Not a .lua file."))
+                continue
+            if info.flag_bits & 0x1:
+                skipped.append((name, "Encrypted entries are not supported."))
+                continue
+            if info.file_size > limits.max_entry_size:
+                skipped.append((name, f"File is too big. (Max: {limits.max_entry_size // (1024 * 1024)}MB)"))
+                continue
+            if info.compress_size and info.file_size / info.compress_size > limits.max_ratio:
+                raise ArchiveError(f"Suspicious compression ratio for {name}.")
+            if total + info.file_size > limits.max_total_size:
+                raise ArchiveError(f"Archive content is too big. (Max: {limits.max_total_size // (1024 * 1024)}MB)")
+
+            chunks = []
+            size = 0
+            try:
+                with archive.open(info) as entry:
+                    while True:
+                        chunk = entry.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > limits.max_entry_size or total + size > limits.max_total_size:
+                            raise ArchiveError(f"Entry {name} is larger than declared.")
+                        chunks.append(chunk)
+            except (BadZipFile, NotImplementedError, zlib.error, EOFError) as e:
+                # Bad CRC, truncated data or an unsupported compression method.
+                raise ArchiveError(f"Entry {name} could not be read: {e}")
+            total += size
+            files.append((name, b''.join(chunks)))
+
+    return files, skipped
+
+
+def content_size(zip_path: str) -> int:
+    """Uncompressed size of an archive written by `build_archive`, as declared in its directory."""
+    with ZipFile(zip_path) as archive:
+        return sum(info.file_size for info in archive.infolist())
+
+
+def build_archive(zip_path: str, files: List[Tuple[str, bytes]], report: str = None) -> str:
+    with ZipFile(zip_path, mode='w', compression=ZIP_DEFLATED, compresslevel=9, allowZip64=True) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+        if report:
+            archive.writestr('errors.txt', report)
+    return zip_path
+
+
+def format_report(errors: List[Tuple[str, str]]) -> str:
+    return '\n'.join(f"{name}:\n{reason}\n" for name, reason in errors)
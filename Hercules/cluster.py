@@ -0,0 +1,144 @@
+"""
+Runs the bot as several worker processes, each owning a contiguous range of shards.
+
+    python cluster.py
+
+CLUSTER_WORKERS sets the number of workers, SHARD_COUNT the total number of shards (default: the count
+recommended by Discord). Worker 0 is the primary: it syncs the command tree and runs the health server.
+A worker that crashes is restarted on its own; a worker that exits cleanly (owner shutdown) stops the cluster.
+"""
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+
+STATUS_MAX_AGE = 120
+RESTART_BACKOFF_MAX = 60
+
+
+def shard_ranges(shard_count: int, workers: int) -> List[List[int]]:
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def write_status(folder: str, worker: int, data: dict):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{worker}.json')
+    with open(f'{path}.tmp', 'w', encoding='utf8') as f:
+        json.dump({**data, "updated": time.time()}, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def read_status(folder: str, exclude: Optional[int] = None, max_age: int = STATUS_MAX_AGE) -> Dict[int, dict]:
+    """Status of every worker that reported within `max_age` seconds."""
+    workers = {}
+    if not os.path.isdir(folder):
+        return workers
+    now = time.time()
+    for entry in os.listdir(folder):
+        name, extension = os.path.splitext(entry)
+        if extension != '.json' or not name.isdigit() or int(name) == exclude:
+            continue
+        try:
+            with open(os.path.join(folder, entry), 'r', encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - data.get('updated', 0) <= max_age:
+            workers[int(name)] = data
+    return workers
+
+
+def recommended_shards(token: str) -> int:
+    request = urllib.request.Request('https://discord.com/api/v10/gateway/bot', headers={'Authorization': f'Bot {token}'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)['shards']
+
+
+class Launcher:
+    def __init__(self, shard_count: int, workers: int, logger: logging.Logger):
+        self.logger = logger
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, workers)
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.restarts: Dict[int, Tuple[int, float]] = {}
+        self.stopping = False
+
+    def spawn(self, worker: int):
+        env = {
+            **os.environ,
+            'CLUSTER_ID': str(worker),
+            'SHARD_IDS': ','.join(map(str, self.ranges[worker])),
+            'SHARD_COUNT': str(self.shard_count),
+            'CLUSTER_WORKERS': str(len(self.ranges)),
+        }
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        self.processes[worker] = subprocess.Popen([sys.executable, main], env=env)
+        self.logger.info(f'Worker {worker} started with shards {self.ranges[worker][0]}-{self.ranges[worker][-1]} (PID {self.processes[worker].pid}).')
+
+    def stop(self, *_):
+        if self.stopping:
+            return
+        self.stopping = True
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for worker in range(len(self.ranges)):
+            self.spawn(worker)
+
+        pending: Dict[int, float] = {}
+        while self.processes or (pending and not self.stopping):
+            time.sleep(1)
+            for worker, process in list(self.processes.items()):
+                code = process.poll()
+                if code is None:
+                    continue
+                del self.processes[worker]
+                if self.stopping:
+                    continue
+                if code == 0:
+                    self.logger.info(f'Worker {worker} shut down, stopping the cluster.')
+                    self.stop()
+                    continue
+                count, last = self.restarts.get(worker, (0, 0.0))
+                count = count + 1 if time.time() - last < RESTART_BACKOFF_MAX * 2 else 1
+                self.restarts[worker] = (count, time.time())
+                delay = min(RESTART_BACKOFF_MAX, 2 ** count)
+                self.logger.warning(f'Worker {worker} exited with code {code}, restarting in {delay}s.')
+                pending[worker] = time.time() + delay
+            for worker, due in list(pending.items()):
+                if not self.stopping and time.time() >= due:
+                    del pending[worker]
+                    self.spawn(worker)
+        return 0
+
+
+if __name__ == '__main__':
+    from CustomModules import log_handler
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Same log folder as the workers, see main.py.
+    LOG_FOLDER = 'Hercules-Bot//Logs//'
+    os.makedirs(LOG_FOLDER, exist_ok=True)
+    log_manager = log_handler.LogManager(LOG_FOLDER, 'Hercules-Cluster', os.getenv('LOG_LEVEL'))
+    cluster_logger = log_manager.get_logger('Cluster')
+    workers = int(os.getenv('CLUSTER_WORKERS', '2'))
+    shard_count = int(os.getenv('SHARD_COUNT') or recommended_shards(os.getenv('TOKEN')))
+    sys.exit(Launcher(shard_count, workers, cluster_logger).run())
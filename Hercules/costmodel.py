@@ -0,0 +1,180 @@
+import collections
+import json
+import math
+import os
+import threading
+import time
+from typing import List, Optional
+
+
+MAX_BITS = 32
+MIN_SAMPLES = 10
+SAMPLE_HISTORY = 500
+# Weight of older samples after every new one, so the model follows API changes.
+DECAY = 0.995
+RIDGE = 1e-3
+DEFAULT_ZIP_RATIO = 0.3
+
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> Optional[List[float]]:
+    """Gaussian elimination with partial pivoting. None if the system is singular."""
+    size = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            if factor:
+                for index in range(column, size + 1):
+                    rows[row][index] -= factor * rows[column][index]
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        solution[row] = (rows[row][size] - sum(rows[row][index] * solution[index] for index in range(row + 1, size))) / rows[row][row]
+    return solution
+
+
+class Estimate:
+    def __init__(self, duration: float, output_size: int, samples: int):
+        self.duration = duration
+        self.output_size = output_size
+        self.samples = samples
+
+
+class CostModel:
+    """Learns the API duration and output size of an obfuscation from the input size and the method bitmask.
+
+    Both are fitted as exponentially weighted ridge regressions on the features
+    [1, size, bit_i, size * bit_i] for every method bit that was ever seen, so each method contributes a fixed
+    and a per-KiB cost. Only the sufficient statistics and a short sample history are kept, in `path`.
+    The regressions are solved on load and after every save, both off the event loop; estimates use the last solution.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.samples = 0
+        self.bits = 0
+        self.zip_ratio = DEFAULT_ZIP_RATIO
+        self.history: collections.deque = collections.deque(maxlen=SAMPLE_HISTORY)
+        size = 2 + 2 * MAX_BITS
+        self._xtx = [[0.0] * size for _ in range(size)]
+        self._xty = {"duration": [0.0] * size, "output": [0.0] * size}
+        self._coefficients = None
+        self._fitted = 0
+        # Jobs record and estimate on the event loop while fits and saves run in worker threads.
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.load()
+        self._fit()
+
+    @staticmethod
+    def _features(size: int, bitmask: int) -> List[float]:
+        kib = size / 1024
+        features = [1.0, kib] + [0.0] * (2 * MAX_BITS)
+        for bit in range(MAX_BITS):
+            if bitmask & (1 << bit):
+                features[2 + bit] = 1.0
+                features[2 + MAX_BITS + bit] = kib
+        return features
+
+    def _active(self) -> List[int]:
+        """Feature indexes of the intercept, the size and every bit seen so far."""
+        bits = [bit for bit in range(MAX_BITS) if self.bits & (1 << bit)]
+        return [0, 1] + [2 + bit for bit in bits] + [2 + MAX_BITS + bit for bit in bits]
+
+    def record(self, size: int, bitmask: int, duration: float, output_size: int):
+        features = self._features(size, bitmask)
+        with self._lock:
+            self._record(features, size, bitmask, duration, output_size)
+
+    def _record(self, features: List[float], size: int, bitmask: int, duration: float, output_size: int):
+        for row in range(len(features)):
+            for column in range(len(features)):
+                self._xtx[row][column] = self._xtx[row][column] * DECAY + features[row] * features[column]
+            self._xty["duration"][row] = self._xty["duration"][row] * DECAY + features[row] * duration
+            self._xty["output"][row] = self._xty["output"][row] * DECAY + features[row] * output_size / 1024
+        self.samples += 1
+        self.bits |= bitmask & ((1 << MAX_BITS) - 1)
+        self.history.append((round(time.time()), size, bitmask, round(duration, 3), output_size))
+
+    def record_compression(self, size: int, compressed_size: int):
+        if size > 0:
+            with self._lock:
+                self.zip_ratio = self.zip_ratio * 0.8 + compressed_size / size * 0.2
+
+    def _fit(self) -> Optional[dict]:
+        with self._lock:
+            if self._fitted == self.samples or self.samples < MIN_SAMPLES:
+                return self._coefficients
+            samples = self.samples
+            active = self._active()
+            matrix = [[self._xtx[row][column] + (RIDGE if row == column else 0.0) for column in active] for row in active]
+            vectors = {target: [xty[row] for row in active] for target, xty in self._xty.items()}
+        coefficients = {}
+        for target, vector in vectors.items():
+            solution = _solve(matrix, vector)
+            if solution is None:
+                return None
+            coefficients[target] = dict(zip(active, solution))
+        with self._lock:
+            if self._fitted < samples:
+                self._coefficients = coefficients
+                self._fitted = samples
+        return coefficients
+
+    def estimate(self, size: int, bitmask: int) -> Optional[Estimate]:
+        """Expected API duration (seconds) and output size (bytes). None until enough jobs were recorded."""
+        coefficients = self._coefficients
+        if coefficients is None:
+            return None
+        features = self._features(size, bitmask)
+        duration = sum(weight * features[index] for index, weight in coefficients["duration"].items())
+        output = sum(weight * features[index] for index, weight in coefficients["output"].items()) * 1024
+        if not (math.isfinite(duration) and math.isfinite(output)):
+            return None
+        return Estimate(max(duration, 0.0), int(max(output, size)), self.samples)
+
+    def delivery(self, output_size: int, upload_limit: int, can_link: bool) -> str:
+        """'raw', 'zip' or 'link': the first way of sending `output_size` bytes that fits the upload limit."""
+        if output_size <= upload_limit:
+            return 'raw'
+        if output_size * self.zip_ratio <= upload_limit or not can_link:
+            return 'zip'
+        return 'link'
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                data = json.load(f)
+            size = 2 + 2 * MAX_BITS
+            if len(data['xtx']) != size or any(len(data['xty'][target]) != size for target in self._xty):
+                return
+            self._xtx = data['xtx']
+            self._xty = {target: data['xty'][target] for target in self._xty}
+            self.samples = data['samples']
+            self.bits = data['bits']
+            self.zip_ratio = data.get('zip_ratio', DEFAULT_ZIP_RATIO)
+            self.history.extend(tuple(sample) for sample in data.get('history', []))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        with self._lock:
+            data = {
+                "samples": self.samples,
+                "bits": self.bits,
+                "zip_ratio": self.zip_ratio,
+                "xtx": [row[:] for row in self._xtx],
+                "xty": {target: xty[:] for target, xty in self._xty.items()},
+                "history": list(self.history),
+            }
+        with self._save_lock:
+            with open(f'{self.path}.tmp', 'w', encoding='utf8') as f:
+                json.dump(data, f)
+            os.replace(f'{self.path}.tmp', self.path)
+        self._fit()
+
+    def snapshot(self) -> dict:
+        return {"samples": self.samples, "fitted": self._coefficients is not None, "zip_ratio": round(self.zip_ratio, 3)}
@@ -0,0 +1,86 @@
+import hashlib
+import re
+import time
+from typing import Dict, List, Tuple
+
+
+_VOLATILE = (
+    (re.compile(r'0x[0-9a-fA-F]+'), '0x?'),
+    (re.compile(r'(?:[A-Za-z]:)?(?:[\\/][\w.-]+)+[\\/]'), ''),
+    (re.compile(r'tmp[\w-]+'), 'tmp?'),
+    (re.compile(r'\d+(?:\.\d+)?\s*m?s\b'), '?s'),
+)
+
+
+def signature(error_text: str) -> str:
+    """Hash of the error text with temp paths, addresses and timings removed."""
+    for pattern, replacement in _VOLATILE:
+        error_text = pattern.sub(replacement, error_text)
+    return hashlib.sha256(error_text.strip().encode('utf-8', errors='replace')).hexdigest()[:16]
+
+
+class DebugReport:
+    def __init__(self, fingerprint: Tuple[str, str], error_text: str, user_id: int):
+        self.fingerprint = fingerprint
+        self.error_text = error_text
+        self.user_id = user_id
+        self.users = {user_id}
+        self.count = 1
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+        self.message = None
+        self.dirty = False
+
+    @property
+    def input_hash(self) -> str:
+        return self.fingerprint[1]
+
+
+class DebugReporter:
+    """Merges identical failures (same error signature and same input) that are reported within `window`
+    seconds into one report. Only the hash of an input is kept; the input itself is uploaded once with the first report."""
+
+    def __init__(self, window: int = 3600, max_reports: int = 64):
+        self.window = window
+        self.max_reports = max_reports
+        self._reports: Dict[Tuple[str, str], DebugReport] = {}
+
+    def record(self, user_id: int, error_text: str, code: bytes) -> Tuple[DebugReport, bool]:
+        """Register one consented report. Returns the report and whether it is new and has to be sent.
+        A merged report counts as sent only once the first one has its `message`."""
+        self.evict()
+        input_hash = hashlib.sha256(code).hexdigest()
+        fingerprint = (signature(error_text), input_hash)
+        report = self._reports.get(fingerprint)
+        if report is not None:
+            report.count += 1
+            report.users.add(user_id)
+            report.last_seen = time.time()
+            report.dirty = True
+            return report, False
+
+        if len(self._reports) >= self.max_reports:
+            self.discard(min(self._reports.values(), key=lambda r: r.last_seen))
+        report = DebugReport(fingerprint, error_text, user_id)
+        self._reports[fingerprint] = report
+        return report, True
+
+    def discard(self, report: DebugReport):
+        self._reports.pop(report.fingerprint, None)
+
+    def evict(self) -> int:
+        now = time.time()
+        expired = [report for report in self._reports.values() if now - report.first_seen > self.window]
+        for report in expired:
+            self.discard(report)
+        return len(expired)
+
+    def pending(self) -> List[DebugReport]:
+        """Reports with new duplicates whose summary message has not been updated yet."""
+        return [report for report in self._reports.values() if report.dirty and report.message is not None]
+
+    def snapshot(self) -> dict:
+        return {
+            "reports": len(self._reports),
+            "duplicates": sum(report.count - 1 for report in self._reports.values()),
+        }
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+import secrets
+import time
+from typing import Dict, Optional
+
+
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]{32}')
+
+
+class Download:
+    def __init__(self, token: str, path: str, filename: str, size: int, expires: float):
+        self.token = token
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.expires = expires
+
+    def to_dict(self) -> dict:
+        return {"filename": self.filename, "size": self.size, "expires": self.expires}
+
+
+class DownloadStore:
+    """Outputs too large for Discord, kept in `folder` under unguessable tokens until they expire.
+    The metadata lives next to each file, so links survive a restart and can be served by another cluster worker."""
+
+    def __init__(self, folder: str, ttl: int = 3600, quota: int = 1024 * 1024 * 1024):
+        self.folder = folder
+        self.ttl = ttl
+        self.quota = quota
+        self._downloads: Dict[str, Download] = {}
+        os.makedirs(folder, exist_ok=True)
+        for entry in os.listdir(folder):
+            token, extension = os.path.splitext(entry)
+            if extension != '.json':
+                continue
+            download = self._load(token)
+            if download is None:
+                os.remove(os.path.join(folder, entry))
+            else:
+                self._downloads[token] = download
+        for entry in os.listdir(folder):
+            token, extension = os.path.splitext(entry)
+            if extension == '.bin' and token not in self._downloads:
+                os.remove(os.path.join(folder, entry))
+        self.evict_expired()
+
+    def _load(self, token: str) -> Optional[Download]:
+        try:
+            with open(os.path.join(self.folder, f'{token}.json'), 'r', encoding='utf8') as f:
+                data = json.load(f)
+            return Download(token, os.path.join(self.folder, f'{token}.bin'), data['filename'], data['size'], data['expires'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @property
+    def used(self) -> int:
+        return sum(download.size for download in self._downloads.values())
+
+    def add(self, source_path: str, filename: str) -> Optional[Download]:
+        """Move `source_path` into the store. Returns None if it does not fit into the quota."""
+        self.evict_expired()
+        size = os.path.getsize(source_path)
+        if self.used + size > self.quota:
+            return None
+        token = secrets.token_urlsafe(24)
+        download = Download(token, os.path.join(self.folder, f'{token}.bin'), filename, size, time.time() + self.ttl)
+        os.replace(source_path, download.path)
+        metadata_path = os.path.join(self.folder, f'{token}.json')
+        with open(f'{metadata_path}.tmp', 'w', encoding='utf8') as f:
+            json.dump(download.to_dict(), f)
+        os.replace(f'{metadata_path}.tmp', metadata_path)
+        self._downloads[token] = download
+        return download
+
+    def get(self, token: str) -> Optional[Download]:
+        if not _TOKEN_RE.fullmatch(token):
+            return None
+        download = self._downloads.get(token)
+        if download is None:
+            # Added by another worker after this store was loaded.
+            download = self._load(token)
+            if download is None:
+                return None
+            self._downloads[token] = download
+        if download.expires < time.time() or not os.path.exists(download.path):
+            self.remove(download)
+            return None
+        return download
+
+    def remove(self, download: Download):
+        self._downloads.pop(download.token, None)
+        for path in (download.path, os.path.join(self.folder, f'{download.token}.json')):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        expired = [download for download in self._downloads.values() if download.expires < now]
+        for download in expired:
+            self.remove(download)
+        return len(expired)
+
+    def snapshot(self) -> dict:
+        return {"files": len(self._downloads), "used": self.used, "quota": self.quota}
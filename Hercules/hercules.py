@@ -1,22 +1,230 @@
 import asyncio
-from typing import Optional, Tuple
+import gzip
+import json
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
 
 import aiohttp
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies below this size are neither compressed nor decoded in a worker thread.
+COMPRESS_MIN_SIZE = 64 * 1024
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=5)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.decompress(data)
+    return data
+
+
+class MethodCatalog:
+    """Immutable snapshot of the methods and presets served by the API, with the derived bitmasks precomputed."""
+
+    def __init__(self, methods: list, presets: dict, api_version: str = 'unknown', revision: int = 0):
+        self.methods: Tuple[dict, ...] = tuple(methods)
+        self.presets: Dict[str, List[str]] = {
+            name.lower(): list(preset.get('methods', [])) for name, preset in presets.items()
+        }
+        self.api_version = api_version
+        self.revision = revision
+        self.bitkeys: Dict[str, int] = {method['key']: method['bitkey'] for method in self.methods}
+        self.enabled_bits = self.bits_for(None)
+        self.preset_bits: Dict[str, int] = {name: self.bits_for(keys) for name, keys in self.presets.items()}
+
+    def bits_for_preset(self, preset_name: Optional[str]) -> int:
+        """Bitmask of a preset by name; every enabled method without one, none for an unknown preset."""
+        if preset_name is None:
+            return self.enabled_bits
+        return self.preset_bits.get(preset_name.lower(), 0)
+
+    def bits_for(self, preset_methods: Optional[list]) -> int:
+        return sum(
+            (1 << method['bitkey'])
+            for method in self.methods
+            if method['enabled'] and (preset_methods is None or method['key'] in preset_methods)
+        )
+
+    def diff(self, other: 'MethodCatalog') -> List[str]:
+        changes = []
+        if self.api_version != other.api_version:
+            changes.append(f"version {self.api_version} -> {other.api_version}")
+        old = {method['key']: method for method in self.methods}
+        new = {method['key']: method for method in other.methods}
+        for key in new.keys() - old.keys():
+            changes.append(f"added method {key} (bit {new[key]['bitkey']})")
+        for key in old.keys() - new.keys():
+            changes.append(f"removed method {key}")
+        for key in old.keys() & new.keys():
+            for field in ('bitkey', 'enabled', 'name'):
+                if old[key].get(field) != new[key].get(field):
+                    changes.append(f"method {key}: {field} {old[key].get(field)} -> {new[key].get(field)}")
+        for name in self.presets.keys() | other.presets.keys():
+            if self.presets.get(name) != other.presets.get(name):
+                changes.append(f"preset {name}: {self.presets.get(name)} -> {other.presets.get(name)}")
+        return changes
+
+
+class AdaptiveLimit:
+    """AIMD limit on the requests in flight to one endpoint.
+
+    Latency is normalized by payload size (per `NORMALIZE_BYTES`) and compared with a slowly rising
+    baseline of the best latency seen for the same request key (the obfuscation bitmask), since the work per
+    byte differs a lot between keys. The limit grows by about one per round of successful requests while at
+    least half of it is in use, and is multiplied by `backoff` on timeouts, 429/5xx responses or after `patience`
+    consecutive samples above `tolerance` x baseline, at most once per measured round trip.
+    """
+
+    NORMALIZE_BYTES = 256 * 1024
+    MAX_BASELINES = 256
+
+    def __init__(self, name: str, initial: int = 4, minimum: int = 1, maximum: int = 64,
+                 tolerance: float = 2.0, backoff: float = 0.7, patience: int = 3):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.patience = patience
+        self.in_flight = 0
+        self.waiting = 0
+        self.rtt: Optional[float] = None
+        self.baselines: Dict[Optional[int], float] = {}
+        self.slow_streak = 0
+        self.errors = 0
+        self.timeouts = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def release(self, rtt: float, size: int, outcome: str, key: Optional[int] = None):
+        """`outcome` is 'ok', 'error' (429/5xx), 'timeout' or 'ignored' (cancelled, no signal)."""
+        now = time.monotonic()
+        if outcome == 'ignored':
+            pass
+        elif outcome == 'ok':
+            self.rtt = rtt if self.rtt is None else self.rtt * 0.8 + rtt * 0.2
+            normalized = rtt / (1 + size / self.NORMALIZE_BYTES)
+            baseline = self.baselines.pop(key, None)
+            if baseline is None or normalized < baseline:
+                baseline = normalized
+            else:
+                # Drift up slowly, so a permanently slower API does not pin the limit to the minimum.
+                baseline += (normalized - baseline) * 0.01
+            # Reinserted, so the least recently used key is the first one dropped.
+            self.baselines[key] = baseline
+            if len(self.baselines) > self.MAX_BASELINES:
+                del self.baselines[next(iter(self.baselines))]
+            self.slow_streak = self.slow_streak + 1 if normalized > baseline * self.tolerance else 0
+            if self.slow_streak >= self.patience:
+                self.slow_streak = 0
+                self._decrease(now)
+            elif not self.slow_streak and self.in_flight >= self.limit / 2:
+                # Only grow while the limit is actually in use.
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        else:
+            if outcome == 'timeout':
+                self.timeouts += 1
+            else:
+                self.errors += 1
+            self._decrease(now)
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _decrease(self, now: float):
+        if now - self._last_decrease < (self.rtt or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "baseline_ms_per_256k": round(min(self.baselines.values()) * 1000, 1) if self.baselines else None,
+            "baseline_keys": len(self.baselines),
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+        }
+
 
 class Hercules:
     """Wrapper for Hercules API providing the same interface as the local implementation."""
 
-    def __init__(self, logger=None, base_url: str = "http://localhost:5000", api_key: str = None):
+    def __init__(self, logger=None, base_url: str = "http://localhost:5000", api_key: str = None, workers: int = 1):
         self.logger = logger
+        self.address = base_url
+        self.socket_path: Optional[str] = None
+        if base_url.startswith('unix://'):
+            # unix:///run/hercules.sock -> HTTP over the socket, the host part of the URL is only used for the Host header.
+            self.socket_path = urlparse(base_url).path
+            if not self.socket_path:
+                # unix://relative.sock parses as a host name, it would silently fall back to TCP.
+                raise ValueError(f"No socket path in {base_url!r}, use an absolute path like unix:///run/hercules.sock.")
+            base_url = 'http://localhost'
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
-        self._methods_cache = None
+        self._catalog = MethodCatalog([], {})
+        self._catalog_data: Dict[str, dict] = {}
+        self._etags: Dict[str, str] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Encoding for request bodies, only set once the API has advertised that it accepts it.
+        self.request_encoding: Optional[str] = None
+        # Cleared the first time the API answers /api/stage with "not found", inputs are then always sent inline.
+        self.staging_supported = True
+        # Every cluster worker limits its own requests, together they get the limits of a single process.
+        workers = max(1, workers)
+        self.limits: Dict[str, AdaptiveLimit] = {
+            "/api/validate": AdaptiveLimit("validate", initial=max(1, 8 // workers), maximum=max(1, 64 // workers)),
+            "/api/obfuscate": AdaptiveLimit("obfuscate", initial=max(1, 4 // workers), maximum=max(1, 64 // workers)),
+        }
 
         self._verify_connection()
 
     def _get_headers(self) -> dict:
-        headers = {"Content-Type": "application/json"}
+        headers = {"Content-Type": "application/json", "Accept-Encoding": "zstd, gzip" if zstandard else "gzip"}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
         return headers
@@ -28,16 +236,20 @@ class Hercules:
             connected, api_info = loop.run_until_complete(self._check_connection())
 
             if not connected:
+                loop.run_until_complete(self.close())
                 loop.close()
                 if self.logger:
                     self.logger.critical(
-                        f"Failed to connect to Hercules API at {self.base_url}. "
+                        f"Failed to connect to Hercules API at {self.address}. "
                         "Ensure the API is running and accessible."
                     )
-                raise ConnectionError(f"Cannot connect to Hercules API at {self.base_url}")
+                raise ConnectionError(f"Cannot connect to Hercules API at {self.address}")
 
-            _, methods_data = loop.run_until_complete(self._make_request("GET", "/api/methods"))
-            self._methods_cache = methods_data.get('methods', [])
+            try:
+                loop.run_until_complete(self.refresh_catalog())
+            finally:
+                # The session is bound to this temporary loop; the bot loop opens its own on first use.
+                loop.run_until_complete(self.close())
             loop.close()
 
             if api_info.get("has_api_key_configured"):
@@ -64,80 +276,261 @@ class Hercules:
                 self.logger.critical(f"Failed to verify API connection: {e}")
             raise
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.UnixConnector(path=self.socket_path) if self.socket_path else None
+            self._session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+        return self._session
+
+    async def close(self):
+        self.stop_catalog_refresh()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def _check_connection(self) -> Tuple[bool, dict]:
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = self._get_headers()
-                async with session.get(
-                    f"{self.base_url}/api/info",
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    data = await response.json()
-                    return response.status == 200, data
+            headers = self._get_headers()
+            async with self._get_session().get(
+                f"{self.base_url}/api/info",
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                data = await self._read(response)
+                offered = data.get("request_encodings") or response.headers.get("Accept-Encoding", "")
+                if zstandard is not None and "zstd" in offered:
+                    self.request_encoding = "zstd"
+                elif "gzip" in offered:
+                    self.request_encoding = "gzip"
+                return response.status == 200, data
         except Exception as e:
             if self.logger:
                 self.logger.warning(f"Connection check failed: {e}")
             return False, {"error": str(e)}
 
-    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Tuple[bool, dict]:
+    async def _read(self, response: aiohttp.ClientResponse, raw: bool = False) -> Union[dict, bytes]:
+        """Decompress and decode the body. With `raw`, a non-JSON body is returned as bytes."""
+        body = await response.read()
+        encoding = response.headers.get("Content-Encoding", "identity").lower()
+        as_json = not raw or response.content_type == "application/json"
+
+        def __decode():
+            data = decompress(body, encoding)
+            return loads(data) if as_json else data
+
+        if len(body) > COMPRESS_MIN_SIZE:
+            return await asyncio.to_thread(__decode)
+        return __decode()
+
+    async def _make_request(self, method: str, endpoint: str, payload: dict = None, raw: bool = False, **kwargs) -> Tuple[bool, Union[dict, bytes]]:
+        status, data, _ = await self._send(method, endpoint, payload, raw, **kwargs)
+        return status == 200, data
+
+    async def _send(self, method: str, endpoint: str, payload: dict = None, raw: bool = False, size: int = None, **kwargs) -> Tuple[int, Union[dict, bytes], float]:
+        """Like `_make_request`, but returns the HTTP status (0 if the request failed before a response) and the
+        round trip time, without the wait for the endpoint's concurrency limit.
+        `size` is the payload size that limit normalizes latency by, the code length by default."""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            started = time.monotonic()
+            status, data = await self._transmit(method, endpoint, payload, raw, **kwargs)
+            return status, data, time.monotonic() - started
+
+        if size is None:
+            size = len(payload.get("code", "")) if payload else 0
+        await limit.acquire()
+        started = time.monotonic()
+        outcome = 'ignored'
+        try:
+            status, data = await self._transmit(method, endpoint, payload, raw, **kwargs)
+            if status == 0 and isinstance(data, dict) and data.get("timeout"):
+                outcome = 'timeout'
+            elif status == 0 or status == 429 or status >= 500:
+                outcome = 'error'
+            else:
+                outcome = 'ok'
+        finally:
+            elapsed = time.monotonic() - started
+            await limit.release(elapsed, size, outcome, payload.get("bitkey") if payload else None)
+        return status, data, elapsed
+
+    async def _transmit(self, method: str, endpoint: str, payload: dict = None, raw: bool = False, **kwargs) -> Tuple[int, Union[dict, bytes]]:
         url = f"{self.base_url}{endpoint}"
         headers = self._get_headers()
+        if raw:
+            headers["Accept"] = "application/octet-stream, application/json;q=0.9"
+        encoding = self.request_encoding
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    method, url, headers=headers, timeout=aiohttp.ClientTimeout(total=30), **kwargs
-                ) as response:
-                    data = await response.json()
-                    if self.logger and endpoint == "/api/obfuscate":
-                        self.logger.info(f"API response status: {response.status}")
-                    return response.status == 200, data
+            if payload is not None:
+                body = dumps(payload)
+                if encoding and len(body) > COMPRESS_MIN_SIZE:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                    headers["Content-Encoding"] = encoding
+                kwargs["data"] = body
+            async with self._get_session().request(
+                method, url, headers=headers, timeout=aiohttp.ClientTimeout(total=30), **kwargs
+            ) as response:
+                if response.status == 415 and "Content-Encoding" in headers:
+                    if self.logger:
+                        self.logger.warning(f"API rejected {encoding} request bodies, sending them uncompressed from now on.")
+                    self.request_encoding = None
+                    kwargs.pop("data")
+                    return await self._transmit(method, endpoint, payload, raw, **kwargs)
+                data = await self._read(response, raw)
+                if self.logger and endpoint == "/api/obfuscate":
+                    self.logger.info(f"API response status: {response.status}")
+                return response.status, data
         except Exception as e:
             if self.logger:
                 self.logger.error(f"API request failed: {e}")
-            return False, {"error": str(e)}
+            return 0, {"error": str(e), "timeout": isinstance(e, asyncio.TimeoutError)}
+
+    def limits_snapshot(self) -> Dict[str, dict]:
+        return {limit.name: limit.snapshot() for limit in self.limits.values()}
 
-    async def _request(self, method: str, endpoint: str, **kwargs) -> Tuple[bool, dict]:
+    async def ping(self) -> Tuple[bool, float]:
+        """Reachability of the API and the round trip time in seconds."""
+        status, _, elapsed = await self._send("GET", "/api/info")
+        return status == 200, elapsed
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Tuple[bool, Union[dict, bytes]]:
         return await self._make_request(method, endpoint, **kwargs)
 
     @property
-    def methods(self) -> list:
-        if self._methods_cache is None:
-            self._methods_cache = []
-        return self._methods_cache
+    def catalog(self) -> MethodCatalog:
+        return self._catalog
 
-    async def get_preset_methods(self, preset_name: str) -> list:
-        success, data = await self._request("GET", "/api/presets")
-        if success:
-            presets = data.get('presets', {})
-            preset = presets.get(preset_name.lower())
-            if preset:
-                return preset.get('methods', [])
-        return []
+    @property
+    def methods(self) -> Tuple[dict, ...]:
+        return self._catalog.methods
 
-    async def obfuscate(self, file_path: str, bitkey: int) -> Tuple[bool, str]:
+    async def _conditional_get(self, endpoint: str) -> Tuple[Optional[dict], Optional[str]]:
+        """GET `endpoint` and return its data and ETag. The data is None if it is unchanged since the last call (HTTP 304)."""
+        headers = self._get_headers()
+        if endpoint in self._etags:
+            headers["If-None-Match"] = self._etags[endpoint]
+        async with self._get_session().get(
+            f"{self.base_url}{endpoint}", headers=headers, timeout=aiohttp.ClientTimeout(total=10)
+        ) as response:
+            if response.status == 304:
+                return None, None
+            response.raise_for_status()
+            return await self._read(response), response.headers.get("ETag")
+
+    async def refresh_catalog(self) -> bool:
+        """Fetch methods, presets and version; swap in a new catalog if anything changed.
+
+        If the API can not be reached or answers with an error, the last known catalog (empty at startup) is kept.
+        """
+        # Nothing is recorded until the new catalog is installed, so a failed refresh is retried in full.
+        catalog_data = dict(self._catalog_data)
+        etags = {}
+        changed = False
+        for endpoint in ("/api/info", "/api/methods", "/api/presets"):
+            try:
+                data, etag = await self._conditional_get(endpoint)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                if self.logger:
+                    self.logger.warning(f"Method catalog refresh failed at {endpoint}, keeping revision {self._catalog.revision}: {e}")
+                return False
+            if etag is not None:
+                etags[endpoint] = etag
+            if data is not None and endpoint == "/api/info":
+                data = {key: data.get(key) for key in ('version', 'obfuscator_version')}
+            if data is not None and data != catalog_data.get(endpoint):
+                catalog_data[endpoint] = data
+                changed = True
+        if not changed:
+            self._etags.update(etags)
+            return False
+
+        info = catalog_data.get("/api/info", {})
+        catalog = MethodCatalog(
+            catalog_data.get("/api/methods", {}).get('methods', []),
+            catalog_data.get("/api/presets", {}).get('presets', {}),
+            f"{info.get('version', 'unknown')}/{info.get('obfuscator_version', 'unknown')}",
+            self._catalog.revision + 1
+        )
+        differences = self._catalog.diff(catalog)
+        self._catalog = catalog
+        self._catalog_data = catalog_data
+        self._etags.update(etags)
+        if self.logger and self._catalog.revision > 1:
+            self.logger.info(f"Method catalog updated to revision {catalog.revision}: {'; '.join(differences) or 'no visible changes'}")
+        return True
+
+    async def _refresh_loop(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_catalog()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Method catalog refresh failed: {e}")
+
+    def start_catalog_refresh(self, interval: int = 300):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop(interval))
+
+    def stop_catalog_refresh(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def stage(self, code: str, input_hash: str) -> Optional[str]:
+        """Upload `code` ahead of the obfuscate call. Returns a handle, or None if the API can not stage inputs."""
+        if not self.staging_supported:
+            return None
+        status, data, _ = await self._send("POST", "/api/stage", payload={"code": code, "sha256": input_hash})
+        if status in (404, 405, 501):
+            self.staging_supported = False
+            if self.logger:
+                self.logger.info("API does not support staged uploads, inputs are sent inline.")
+            return None
+        if status != 200 or not isinstance(data, dict):
+            return None
+        return data.get("handle")
+
+    async def obfuscate(self, file_path: str, bitkey: int, job_id: str = None, handle: str = None) -> Tuple[bool, Union[bytes, str], float]:
+        """Obfuscate the file in place. Returns the output as bytes, or the error message on failure, and the
+        duration of the API round trip."""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 code = f.read()
         except Exception as e:
             if self.logger:
                 self.logger.error(f"Could not read file {file_path}: {e}")
-            return False, f"Could not read file: {e}"
+            return False, f"Could not read file: {e}", 0.0
+
+        success, output, duration = await self.obfuscate_code(code, bitkey, job_id, handle)
+        if success:
+            with open(file_path, 'wb') as f:
+                f.write(output)
+        return success, output, duration
 
-        payload = {"code": code, "bitkey": bitkey}
+    async def obfuscate_code(self, code: str, bitkey: int, job_id: str = None, handle: str = None) -> Tuple[bool, Union[bytes, str], float]:
         if self.logger:
-            self.logger.info(f"API obfuscate request - bitkey: {bitkey}, payload methods: {payload}")
+            self.logger.info(f"API obfuscate request{' (staged)' if handle else ''}", extra={"job_id": job_id, "size": len(code), "bitkey": bitkey})
 
-        success, data = await self._request("POST", "/api/obfuscate", json=payload)
+        status = None
+        if handle is not None:
+            status, data, duration = await self._send("POST", "/api/obfuscate", payload={"handle": handle, "bitkey": bitkey}, raw=True, size=len(code))
+            if status in (400, 404, 410):
+                # The handle expired or is unknown to this API instance.
+                status = None
+        if status is None:
+            status, data, duration = await self._send("POST", "/api/obfuscate", payload={"code": code, "bitkey": bitkey}, raw=True)
+        success = status == 200
+        if isinstance(data, bytes):
+            # The API answered with the bare script, it goes to Discord without ever becoming a str.
+            return (True, data, duration) if success else (False, data.decode('utf-8', errors='replace'), duration)
         if success:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(data.get("obfuscated_code", ""))
-            return True, data.get("obfuscated_code", "")
-        return False, data.get("details", data.get("error", "Unknown error"))
+            return True, data.get("obfuscated_code", "").encode('utf-8'), duration
+        return False, data.get("details", data.get("error", "Unknown error")), duration
 
     async def isValidLUASyntax(self, code: str) -> Tuple[bool, str]:
-        success, data = await self._request("POST", "/api/validate", json={"code": code})
+        success, data = await self._request("POST", "/api/validate", payload={"code": code})
         if success:
             return data.get("valid", False), data.get("output", "")
         return False, data.get("error", "Unknown error")
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import time
+from typing import List, Optional
+
+
+class Job:
+    """An accepted obfuscation request whose input waits in the buffer folder until it is submitted."""
+
+    def __init__(self, job_id: str, user_id: int, guild_id: Optional[int], kind: str, name: str,
+                 created: float = None, state: str = 'selecting', errors: List[list] = None,
+                 input_hash: str = None, bitmask: int = None, application_id: int = None,
+                 token: str = None, submitted: float = None, updated: float = None, worker: int = 0):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.kind = kind
+        self.name = name
+        self.created = created or time.time()
+        self.state = state
+        self.errors = errors or []
+        self.input_hash = input_hash
+        self.bitmask = bitmask
+        self.application_id = application_id
+        self.token = token
+        self.submitted = submitted
+        self.updated = updated or self.created
+        self.worker = worker
+
+
+class JobStore:
+    """SQLite (WAL) journal of jobs. Together with the input kept in the buffer folder it lets a job be
+    submitted from a later interaction, or resumed by a later process, as long as its followup token is valid.
+    In cluster mode every worker shares the journal; a job belongs to the worker that saved it last."""
+
+    ACTIVE_STATES = ('queued', 'running', 'delivering')
+    FINAL_STATES = ('done', 'failed', 'expired')
+    _COLUMNS = ('job_id', 'user_id', 'guild_id', 'kind', 'name', 'created', 'state', 'errors',
+                'input_hash', 'bitmask', 'application_id', 'token', 'submitted', 'updated', 'worker')
+
+    def __init__(self, folder: str, db_path: str, ttl: int = 900, retention: int = 86400, worker: int = 0):
+        self.folder = folder
+        self.worker = worker
+        self.ttl = ttl
+        self.retention = retention
+        # Autocommit, so single statements may also run from worker threads (load() for the selection estimates).
+        self._db = sqlite3.connect(db_path, isolation_level=None, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'job_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, guild_id INTEGER, kind TEXT NOT NULL, '
+            'name TEXT NOT NULL, created REAL NOT NULL, state TEXT NOT NULL, errors TEXT NOT NULL, '
+            'input_hash TEXT, bitmask INTEGER, application_id INTEGER, token TEXT, submitted REAL, updated REAL NOT NULL, '
+            'worker INTEGER NOT NULL DEFAULT 0)'
+        )
+        if 'worker' not in {column[1] for column in self._db.execute('PRAGMA table_info(jobs)')}:
+            self._db.execute('ALTER TABLE jobs ADD COLUMN worker INTEGER NOT NULL DEFAULT 0')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, updated)')
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_hex(6)
+
+    def input_path(self, job: Job) -> str:
+        extension = 'zip' if job.kind == 'archive' else 'lua'
+        return os.path.abspath(f'{self.folder}{job.job_id}.{extension}')
+
+    def _row_to_job(self, row: tuple) -> Job:
+        data = dict(zip(self._COLUMNS, row))
+        data['errors'] = json.loads(data['errors'])
+        return Job(**data)
+
+    def save(self, job: Job):
+        """Insert or replace the job. The input file has to be written before, it is hashed here."""
+        if job.input_hash is None and os.path.exists(self.input_path(job)):
+            digest = hashlib.sha256()
+            with open(self.input_path(job), 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            job.input_hash = digest.hexdigest()
+        job.updated = time.time()
+        job.worker = self.worker
+        self._db.execute(
+            f'INSERT OR REPLACE INTO jobs ({", ".join(self._COLUMNS)}) VALUES ({", ".join("?" * len(self._COLUMNS))})',
+            (job.job_id, job.user_id, job.guild_id, job.kind, job.name, job.created, job.state, json.dumps(job.errors),
+             job.input_hash, job.bitmask, job.application_id, job.token, job.submitted, job.updated, job.worker)
+        )
+
+    def load(self, job_id: str) -> Optional[Job]:
+        row = self._db.execute(f'SELECT {", ".join(self._COLUMNS)} FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        if job.state == 'selecting' and time.time() - job.created > self.ttl:
+            return None
+        if not os.path.exists(self.input_path(job)):
+            return None
+        return job
+
+    def set_state(self, job: Job, state: str):
+        job.state = state
+        job.updated = time.time()
+        self._db.execute('UPDATE jobs SET state = ?, updated = ? WHERE job_id = ?', (state, job.updated, job.job_id))
+
+    def submit(self, job: Job, bitmask: int, application_id: int, token: str):
+        """Record the selection and the followup token that will deliver the result."""
+        job.bitmask = bitmask
+        job.application_id = application_id
+        job.token = token
+        job.submitted = time.time()
+        job.state = 'queued'
+        self.save(job)
+
+    def finish(self, job: Job, state: str):
+        self.set_state(job, state)
+        if os.path.exists(self.input_path(job)):
+            os.remove(self.input_path(job))
+
+    def resumable(self, token_ttl: int) -> List[Job]:
+        rows = self._db.execute(
+            f'SELECT {", ".join(self._COLUMNS)} FROM jobs WHERE state IN ({", ".join("?" * len(self.ACTIVE_STATES))}) AND submitted > ? AND worker = ?',
+            (*self.ACTIVE_STATES, time.time() - token_ttl, self.worker)
+        ).fetchall()
+        return [job for job in map(self._row_to_job, rows) if os.path.exists(self.input_path(job))]
+
+    def compact(self, token_ttl: int = 900) -> int:
+        """Expire abandoned jobs, drop old finished entries and their inputs, and truncate the WAL."""
+        now = time.time()
+        stale = self._db.execute(
+            f'SELECT {", ".join(self._COLUMNS)} FROM jobs WHERE (state = ? AND created < ?) '
+            f'OR (state IN ({", ".join("?" * len(self.ACTIVE_STATES))}) AND submitted < ?)',
+            ('selecting', now - self.ttl, *self.ACTIVE_STATES, now - token_ttl)
+        ).fetchall()
+        for job in map(self._row_to_job, stale):
+            self.finish(job, 'expired')
+        removed = self._db.execute(
+            f'DELETE FROM jobs WHERE state IN ({", ".join("?" * len(self.FINAL_STATES))}) AND updated < ?',
+            (*self.FINAL_STATES, now - self.retention)
+        ).rowcount
+        self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return len(stale) + removed
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,106 @@
+import atexit
+import collections
+import hashlib
+import logging
+import logging.handlers
+import queue
+from typing import Dict, List
+
+
+STRUCTURED_FIELDS = ('job_id', 'size', 'bitkey')
+
+
+class RedactingFilter(logging.Filter):
+    """Caps the rendered message at `max_length` characters and appends the structured job fields."""
+
+    def __init__(self, max_length: int):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if len(message) > self.max_length:
+            digest = hashlib.sha256(message.encode('utf-8', errors='replace')).hexdigest()[:16]
+            message = f"{message[:self.max_length]}... [{len(message) - self.max_length} chars truncated, sha256:{digest}]"
+        fields = ' '.join(f"{field}={getattr(record, field)}" for field in STRUCTURED_FIELDS if getattr(record, field, None) is not None)
+        if fields:
+            message = f"{message} [{fields}]"
+        record.msg = message
+        record.args = None
+        return True
+
+
+class _RoutedQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue, route: str):
+        super().__init__(log_queue)
+        self.route = route
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.route = self.route
+        return record
+
+
+class _RoutingHandler(logging.Handler):
+    """Runs on the listener thread and hands each record to the handlers its logger originally had."""
+
+    def __init__(self, routes: Dict[str, List[logging.Handler]]):
+        super().__init__()
+        self.routes = routes
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in self.routes.get(getattr(record, 'route', None), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def flush(self):
+        for handlers in self.routes.values():
+            for handler in handlers:
+                handler.flush()
+
+
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+        self.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s'))
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(self.format(record))
+
+    def recent(self, lines: int = None) -> List[str]:
+        records = list(self.records)
+        return records[-lines:] if lines and lines > 0 else records
+
+
+class QueueLogging:
+    """Moves the handlers of the given loggers behind a queue, so file and console writes happen on one background thread."""
+
+    def __init__(self, loggers: List[logging.Logger], max_length: int = 2000, ring_size: int = 1000):
+        self.queue = queue.Queue()
+        self.ring = RingBufferHandler(ring_size)
+        routes = {}
+        for logger in loggers:
+            if not logger.handlers:
+                continue
+            routes[logger.name] = list(logger.handlers)
+            for handler in routes[logger.name]:
+                logger.removeHandler(handler)
+            queue_handler = _RoutedQueueHandler(self.queue, logger.name)
+            queue_handler.addFilter(RedactingFilter(max_length))
+            logger.addHandler(queue_handler)
+        self.routing = _RoutingHandler(routes)
+        self.listener = logging.handlers.QueueListener(self.queue, self.routing, self.ring)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def flush(self):
+        """Block until every queued record has been written. Call it from a worker thread."""
+        self.queue.join()
+        self.routing.flush()
+
+    def stop(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.routing.flush()
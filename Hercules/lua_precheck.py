@@ -0,0 +1,214 @@
+"""
+Fast structural pre-check for Lua 5.1 / Luau sources.
+
+It only rejects input that can never be valid (binary data, unterminated strings or long brackets,
+unbalanced blocks and brackets, stray symbols). Anything that passes still has to be validated by the
+Hercules API, so the checker errs on the side of accepting code.
+"""
+import re
+from typing import Tuple
+
+
+_NAME_CHAR = r'[A-Za-z0-9_\x80-\U0010ffff]'
+_KEYWORDS = r'(?:function|do|if|while|for|repeat|then|elseif|else|end|until|return|and|or|not|in)'
+
+# Everything that does not affect block structure is consumed in one run; the last token of the run is
+# kept in `prev` because `if` after an operator or `return` starts a Luau if-expression.
+_TOKEN_RE = re.compile(rf'''
+    (?P<skip>(?:
+        \s++
+      | --(?:\[(?P<ceq>=*)\[.*?\](?P=ceq)\]|(?!\[=*\[)[^\n]*+)
+      | (?P<prev>
+            (?!{_KEYWORDS}(?!{_NAME_CHAR}))[A-Za-z_\x80-\U0010ffff]{_NAME_CHAR}*+
+          | \.?[0-9](?:[eEpP][+-]|[0-9A-Za-z_.])*+
+          | "(?:[^"\\\r\n]++|\\z\s*+|\\.)*+"
+          | '(?:[^'\\\r\n]++|\\z\s*+|\\.)*+'
+          | \[(?P<seq>=*)\[.*?\](?P=seq)\]
+          | \.\.\.|\.\.=?|::|->|//=?|<<|>>|[=~<>+\-*/%^]=|-(?!-)|[+*/%^\#&|~<>=;:,.?@]
+        )
+    )++)
+  | (?P<keyword>{_KEYWORDS})(?!{_NAME_CHAR})
+  | (?P<ucomment>--)
+  | (?P<unterminated>["']|\[=*\[)
+  | (?P<bracket>[()\[\]{{}}])
+  | (?P<interp>`)
+  | (?P<bad>.)
+''', re.VERBOSE | re.DOTALL)
+
+_INTERP_RE = re.compile(r'(?:[^`\\{]++|\\.)*+(?P<end>[`{])?', re.DOTALL)
+
+_CLOSERS = {')': '(', ']': '[', '}': '{'}
+_OPENER_CLOSE = {'(': ')', '[': ']', '{': '}'}
+# '>' is left out: it mostly closes a generic type (`local x: Array<number>`), after which `if` starts a statement.
+_EXPR_PREV = {
+    '=', '(', ',', '{', '[', 'return', 'and', 'or', 'not', 'in', 'until', 'while', 'if', 'elseif',
+    '..', '+', '-', '*', '/', '//', '%', '^', '#', '==', '~=', '<', '<=', '>=',
+    '+=', '-=', '*=', '/=', '//=', '%=', '^=', '..=', '<expr>',
+}
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0e-\x1f]')
+BINARY_SAMPLE_SIZE = 4096
+
+
+class LuaPrecheckError(Exception):
+    def __init__(self, message: str, code: str, pos: int):
+        self.message = message
+        self.line = code.count('\n', 0, pos) + 1
+        self.column = pos - code.rfind('\n', 0, pos)
+        super().__init__(f"line {self.line}, column {self.column}: {message}")
+
+
+def _line_of(code: str, pos: int) -> int:
+    return code.count('\n', 0, pos) + 1
+
+
+def _raise_token_error(code: str, token: re.Match):
+    kind = token.lastgroup
+    start = token.start(kind)
+    if kind == 'ucomment':
+        raise LuaPrecheckError("unfinished long comment", code, start)
+    if kind == 'unterminated':
+        raise LuaPrecheckError("unfinished long string" if token.group(kind).startswith('[') else "unfinished string", code, start)
+    raise LuaPrecheckError(f"unexpected symbol near '{token.group(kind)}'", code, start)
+
+
+def _skip_interpolated(code: str, pos: int) -> int:
+    """Return the position after the Luau interpolated string starting at `pos` (the opening backtick)."""
+    start = pos
+    pos += 1
+    while True:
+        match = _INTERP_RE.match(code, pos)
+        end = match.group('end')
+        if end is None:
+            raise LuaPrecheckError("unfinished interpolated string", code, start)
+        pos = match.end()
+        if end == '`':
+            return pos
+        depth = 1
+        while depth:
+            token = _TOKEN_RE.match(code, pos)
+            if token is None:
+                raise LuaPrecheckError("unfinished interpolated string", code, start)
+            kind = token.lastgroup
+            if kind == 'interp':
+                pos = _skip_interpolated(code, token.start())
+                continue
+            if kind in ('ucomment', 'unterminated', 'bad'):
+                _raise_token_error(code, token)
+            if kind == 'bracket':
+                if token.group(kind) == '{':
+                    depth += 1
+                elif token.group(kind) == '}':
+                    depth -= 1
+            pos = token.end()
+
+
+def check(code: str) -> None:
+    """Raise LuaPrecheckError if `code` can not be a valid Lua 5.1 / Luau chunk."""
+    sample = code[:BINARY_SAMPLE_SIZE]
+    if sample.startswith('\x1b'):
+        raise LuaPrecheckError("precompiled bytecode is not supported", code, 0)
+    if '\x00' in sample or len(_CONTROL_CHARS.findall(sample)) > max(8, len(sample) // 10):
+        raise LuaPrecheckError("the file looks like binary data, not Lua source", code, 0)
+
+    pos = 0
+    if code.startswith('#'):
+        newline = code.find('\n')
+        pos = len(code) if newline == -1 else newline
+
+    stack = []
+    prev = None
+    length = len(code)
+    match = _TOKEN_RE.match
+
+    while pos < length:
+        token = match(code, pos)
+        kind = token.lastgroup
+        start = token.start()
+        pos = token.end()
+
+        if kind == 'skip':
+            if token.group('prev') is not None:
+                prev = token.group('prev')
+            continue
+
+        if kind == 'keyword':
+            value = token.group(kind)
+            top = stack[-1][0] if stack else None
+            if value == 'function' or value == 'while' or value == 'for' or value == 'repeat':
+                stack.append((value, start))
+            elif value == 'do':
+                if top == 'while' or top == 'for':
+                    stack[-1] = (f'{top}_do', stack[-1][1])
+                else:
+                    stack.append(('do', start))
+            elif value == 'if':
+                stack.append(('ifexpr' if prev in _EXPR_PREV else 'if', start))
+            elif value == 'then' or value == 'elseif':
+                if top != 'if' and top != 'ifexpr':
+                    raise LuaPrecheckError(f"unexpected '{value}'", code, start)
+                if value == 'then' and top == 'ifexpr':
+                    value = '<expr>'
+            elif value == 'else':
+                if top == 'ifexpr':
+                    stack.pop()
+                    value = '<expr>'
+                elif top == 'if':
+                    stack[-1] = ('if_else', stack[-1][1])
+                else:
+                    raise LuaPrecheckError("unexpected 'else'", code, start)
+            elif value == 'until':
+                if top != 'repeat':
+                    _raise_unclosed(code, stack, start, "'until'")
+                stack.pop()
+            elif value == 'end':
+                if top not in ('function', 'do', 'if', 'if_else', 'while_do', 'for_do'):
+                    _raise_unclosed(code, stack, start, "'end'")
+                stack.pop()
+            prev = value
+        elif kind == 'bracket':
+            value = token.group(kind)
+            if value in _OPENER_CLOSE:
+                stack.append((value, start))
+            else:
+                if not stack or stack[-1][0] != _CLOSERS[value]:
+                    _raise_unclosed(code, stack, start, f"'{value}'")
+                stack.pop()
+            prev = value
+        elif kind == 'interp':
+            pos = _skip_interpolated(code, start)
+            prev = kind
+        else:
+            _raise_token_error(code, token)
+
+    if stack:
+        _raise_unclosed(code, stack, length, "<eof>")
+
+
+def _raise_unclosed(code: str, stack: list, pos: int, near: str):
+    if not stack:
+        raise LuaPrecheckError(f"'<eof>' expected near {near}", code, pos)
+    kind, start = stack[-1]
+    if kind in _OPENER_CLOSE:
+        expected = f"'{_OPENER_CLOSE[kind]}'"
+    elif kind == 'repeat':
+        expected = "'until'"
+    elif kind in ('while', 'for'):
+        expected = "'do'"
+    elif kind == 'ifexpr':
+        expected = "'else'"
+    else:
+        expected = "'end'"
+    opener = kind.split('_')[0].replace('ifexpr', 'if')
+    raise LuaPrecheckError(f"{expected} expected (to close '{opener}' at line {_line_of(code, start)}) near {near}", code, pos)
+
+
+def precheck(code: str) -> Tuple[bool, str]:
+    """Same return shape as `Hercules.isValidLUASyntax`: `(True, "")` or `(False, diagnostic)`."""
+    try:
+        check(code)
+    except LuaPrecheckError as e:
+        return False, str(e)
+    except RecursionError:
+        return True, ""
+    return True, ""
+
@@ -2,20 +2,38 @@
 import time
 startupTime_start = time.time()
 import aiohttp
+import archive
 import asyncio
+import cluster
+import collections
+import contextlib
+import costmodel
 import datetime
+import debugreport
 import discord
+import downloads
 import hercules
+import io
+import jobs
 import json
 import jsonschema
+import logging
+import logqueue
+import lua_precheck
+import membudget
 import os
 import platform
+import profiling
 import psutil
+import ratelimit
 import re
 import sentry_sdk
+import shardmonitor
 import signal
 import sys
 import tempfile
+import tracing
+import types
 from CustomModules import bot_directory
 from CustomModules import log_handler
 from dotenv import load_dotenv
@@ -35,7 +53,11 @@ os.makedirs(f'{APP_FOLDER_NAME}//Logs', exist_ok=True)
 os.makedirs(f'{APP_FOLDER_NAME}//Buffer', exist_ok=True)
 LOG_FOLDER = f'{APP_FOLDER_NAME}//Logs//'
 BUFFER_FOLDER = f'{APP_FOLDER_NAME}//Buffer//'
+DOWNLOAD_FOLDER = f'{APP_FOLDER_NAME}//Downloads//'
 ACTIVITY_FILE = f'{APP_FOLDER_NAME}//activity.json'
+JOBS_DB = f'{APP_FOLDER_NAME}//jobs.sqlite3'
+COST_MODEL_FILE = f'{APP_FOLDER_NAME}//costmodel.json'
+CLUSTER_FOLDER = f'{APP_FOLDER_NAME}//Cluster//'
 BOT_VERSION = "1.5.0"
 sentry_sdk.init(
     dsn=os.getenv('SENTRY_DSN'),
@@ -53,13 +75,70 @@ TOPGG_TOKEN = os.getenv('TOPGG_TOKEN')
 DEBUG_CHANNEL_ID = int(os.getenv('DEBUG_CHANNEL', '1358836394398847155'))
 HERCULES_API_URL = os.getenv('HERCULES_API_URL', 'http://localhost:5000')
 HERCULES_API_KEY = os.getenv('HERCULES_API_KEY')
-
-log_manager = log_handler.LogManager(LOG_FOLDER, BOT_NAME, LOG_LEVEL)
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8080'))
+# /metrics, /ready and /shards expose internals and are only served on this listener, by default to the host itself.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '8081'))
+PUBLIC_URL = os.getenv('PUBLIC_URL', '').rstrip('/')
+DOWNLOAD_TTL = int(os.getenv('DOWNLOAD_TTL', '3600'))
+DOWNLOAD_QUOTA = int(os.getenv('DOWNLOAD_QUOTA_MB', '1024')) * 1024 * 1024
+MEMORY_BUDGET = int(os.getenv('MEMORY_BUDGET_MB', '512')) * 1024 * 1024
+MEMORY_BUDGET_WAIT = int(os.getenv('MEMORY_BUDGET_WAIT', '10'))
+READY_PROBE_INTERVAL = int(os.getenv('READY_PROBE_INTERVAL', '30'))
+READY_MAX_ACTIVE_JOBS = int(os.getenv('READY_MAX_ACTIVE_JOBS', '50'))
+# Share of disconnected shards from which /ready reports "down" instead of "degraded".
+READY_DOWN_THRESHOLD = float(os.getenv('READY_DOWN_THRESHOLD', '0.5'))
+SHARD_MONITOR_INTERVAL = int(os.getenv('SHARD_MONITOR_INTERVAL', '15'))
+# A shard whose heartbeat latency stays this many times above the fleet median gets reconnected.
+SHARD_OUTLIER_FACTOR = float(os.getenv('SHARD_OUTLIER_FACTOR', '3'))
+BOTINFO_CACHE_TTL = 30
+MAX_ARCHIVE_SIZE = 1024 * 1024 * 10
+# Upload limit outside of boosted guilds.
+DISCORD_UPLOAD_LIMIT = 1024 * 1024 * 10
+ARCHIVE_CONCURRENCY = int(os.getenv('ARCHIVE_CONCURRENCY', '4'))
+RATELIMIT_USER = os.getenv('RATELIMIT_USER', '10,0.02')
+RATELIMIT_GUILD = os.getenv('RATELIMIT_GUILD', '40,0.1')
+RATELIMIT_GLOBAL = os.getenv('RATELIMIT_GLOBAL', '200,1')
+PERSISTENT_COMPONENTS = os.getenv('PERSISTENT_COMPONENTS', 'true').lower() == 'true'
+CATALOG_REFRESH_INTERVAL = int(os.getenv('CATALOG_REFRESH_INTERVAL', '300'))
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '60'))
+# Set by cluster.py for each worker process. Without them the bot runs every shard in this process.
+CLUSTER_ID = int(os.getenv('CLUSTER_ID')) if os.getenv('CLUSTER_ID') else None
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS').split(',')] if os.getenv('SHARD_IDS') else None
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+# The global rate limit, the memory budget and the API concurrency are shared evenly between the workers.
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', '1')) if CLUSTER_ID is not None else 1
+IS_PRIMARY = not CLUSTER_ID
+LOG_NAME = BOT_NAME if CLUSTER_ID is None else f'{BOT_NAME}-{CLUSTER_ID}'
+# Interaction tokens are valid for 15 minutes; keep a margin for the obfuscation itself.
+JOB_TOKEN_TTL = 14 * 60
+LOG_MAX_FIELD_LENGTH = int(os.getenv('LOG_MAX_FIELD_LENGTH', '2000'))
+LOG_RING_SIZE = int(os.getenv('LOG_RING_SIZE', '1000'))
+DEBUG_REPORT_WINDOW = int(os.getenv('DEBUG_REPORT_WINDOW', '3600'))
+DEBUG_REPORT_FLUSH_INTERVAL = 30
+DEBUG_INLINE_LIMIT = 1700
+
+log_manager = log_handler.LogManager(LOG_FOLDER, LOG_NAME, LOG_LEVEL)
 discord_logger = log_manager.get_logger('discord')
 program_logger = log_manager.get_logger('Program')
+queue_logging = logqueue.QueueLogging([discord_logger, program_logger], LOG_MAX_FIELD_LENGTH, LOG_RING_SIZE)
 program_logger.info('Engine powering up...')
 
-Hercules = hercules.Hercules(program_logger, HERCULES_API_URL, HERCULES_API_KEY)
+Hercules = hercules.Hercules(program_logger, HERCULES_API_URL, HERCULES_API_KEY, CLUSTER_WORKERS)
+
+def _bucket_config(value: str, share: int = 1) -> ratelimit.BucketConfig:
+    capacity, rate = value.split(',')
+    return ratelimit.BucketConfig(float(capacity) / share, float(rate) / share)
+# A guild lives on a single shard, so only the global bucket has to be split between the workers.
+rate_limiter = ratelimit.RateLimiter(_bucket_config(RATELIMIT_USER), _bucket_config(RATELIMIT_GUILD), _bucket_config(RATELIMIT_GLOBAL, CLUSTER_WORKERS))
+job_store = jobs.JobStore(BUFFER_FOLDER, JOBS_DB, worker=CLUSTER_ID or 0)
+debug_reporter = debugreport.DebugReporter(DEBUG_REPORT_WINDOW)
+profiler = profiling.Profiler()
+memory_budget = membudget.MemoryBudget(MEMORY_BUDGET // CLUSTER_WORKERS)
+tracer = tracing.Tracer(int(os.getenv('TRACE_BUFFER_SIZE', '200')))
+download_store = downloads.DownloadStore(DOWNLOAD_FOLDER, DOWNLOAD_TTL, DOWNLOAD_QUOTA)
+cost_model = costmodel.CostModel(COST_MODEL_FILE)
+shard_monitor = shardmonitor.ShardMonitor(factor=SHARD_OUTLIER_FACTOR)
 
 class JSONValidator:
     schema = {
@@ -107,12 +186,127 @@ validator = JSONValidator(ACTIVITY_FILE)
 validator.validate_and_fix_json()
 
 
+class GuildCounter():
+    """Guild and member totals, kept up to date from gateway events instead of walking every guild.
+    Without the privileged members intent there are no member events, so member counts refresh on guild
+    join/remove and when a shard becomes ready or resumes."""
+
+    def __init__(self):
+        self._member_counts: dict[int, int] = {}
+        self.members = 0
+        # Totals of the other cluster workers, refreshed from their status files.
+        self.remote_guilds = 0
+        self.remote_members = 0
+
+    @property
+    def guilds(self) -> int:
+        return len(self._member_counts)
+
+    @property
+    def total_guilds(self) -> int:
+        return self.guilds + self.remote_guilds
+
+    @property
+    def total_members(self) -> int:
+        return self.members + self.remote_members
+
+    def recount(self, guilds):
+        self._member_counts = {guild.id: guild.member_count or 0 for guild in guilds}
+        self.members = sum(self._member_counts.values())
+
+    def add_guild(self, guild):
+        self.remove_guild(guild)
+        count = guild.member_count or 0
+        self._member_counts[guild.id] = count
+        self.members += count
+
+    def remove_guild(self, guild):
+        self.members -= self._member_counts.pop(guild.id, 0)
+
+
+class DirectoryStats(bot_directory.Stats):
+    """Posts the counts of the whole cluster from the GuildCounter instead of walking every guild of this process."""
+
+    def _topgg_data(self):
+        return {"server_count": self.bot.counter.total_guilds, "shard_count": self.bot.shard_count}
+
+    def _discordbots_data(self):
+        return {"guildCount": self.bot.counter.total_guilds, "shardCount": self.bot.shard_count}
+
+    def _discordbotlist_com_data(self):
+        return {"guilds": self.bot.counter.total_guilds, "users": self.bot.counter.total_members}
+
+    def _discordlist_data(self):
+        return {"count": self.bot.counter.total_guilds}
+
+
+class Drain():
+    """Counts in-flight obfuscation work so a shutdown can let it finish before closing the bot."""
+
+    def __init__(self):
+        self.draining = False
+        self.active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: collections.Counter = collections.Counter()
+
+    @contextlib.contextmanager
+    def track(self):
+        task = asyncio.current_task()
+        self.active += 1
+        self._tasks[task] += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._tasks[task] -= 1
+            if self._tasks[task] <= 0:
+                del self._tasks[task]
+            if self.active == 0:
+                self._idle.set()
+
+    async def abandon(self):
+        """Cancel the tasks still doing tracked work and wait for them to unwind."""
+        tasks = [task for task in self._tasks if task is not asyncio.current_task() and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+drain = Drain()
+
+
+class ResumedInteraction():
+    """Stands in for the interaction of a job resumed after a restart. Replies go through the journaled followup token."""
+
+    def __init__(self, job):
+        self.user = types.SimpleNamespace(id=job.user_id, mention=f'<@{job.user_id}>')
+        self.guild_id = job.guild_id
+        self.application_id = job.application_id
+        self.token = job.token
+        self.followup = discord.Webhook.from_state(data={'id': job.application_id, 'type': 3, 'token': job.token}, state=bot._connection)
+
+    async def delete_original_response(self):
+        try:
+            await self.followup.delete_message('@original')
+        except discord.HTTPException:
+            pass
+
+
 class aclient(discord.AutoShardedClient):
     def __init__(self):
         intents = discord.Intents.default()
-        super().__init__(owner_id=OWNERID, intents=intents, status=discord.Status.invisible, auto_reconnect=True)
+        sharding = {'shard_ids': SHARD_IDS, 'shard_count': SHARD_COUNT} if SHARD_IDS else {}
+        super().__init__(owner_id=OWNERID, intents=intents, status=discord.Status.invisible, auto_reconnect=True, **sharding)
         self.synced = False
         self.initialized = False
+        self.counter = GuildCounter()
 
     class Presence():
         @staticmethod
@@ -182,10 +376,25 @@ class aclient(discord.AutoShardedClient):
                 sentry_sdk.capture_exception(error)
 
     async def on_guild_join(self, guild):
+        self.counter.add_guild(guild)
         if not self.synced:
             return
         discord_logger.info(f'I joined {guild}. (ID: {guild.id})')
 
+    async def on_shard_ready(self, shard_id):
+        shard_monitor.record_event(shard_id, 'ready')
+        self.counter.recount(self.guilds)
+
+    async def on_shard_connect(self, shard_id):
+        shard_monitor.record_event(shard_id, 'connect')
+
+    async def on_shard_disconnect(self, shard_id):
+        shard_monitor.record_event(shard_id, 'disconnect')
+
+    async def on_shard_resumed(self, shard_id):
+        shard_monitor.record_event(shard_id, 'resumed')
+        self.counter.recount(self.guilds)
+
     async def on_message(self, message):
         async def __wrong_selection():
             await message.channel.send('```'
@@ -194,6 +403,9 @@ class aclient(discord.AutoShardedClient):
                                        'log - Get the log\n'
                                        'activity - Set the activity of the bot\n'
                                        'status - Set the status of the bot\n'
+                                       'ratelimit - Show or tune the obfuscation rate limits\n'
+                                       'trace - Show job stage timings\n'
+                                       'profile - Profile CPU or memory of the running bot\n'
                                        'shutdown - Shutdown the bot\n'
                                        '```')
 
@@ -213,6 +425,15 @@ class aclient(discord.AutoShardedClient):
             elif command == 'status':
                 await Owner.status(message, args)
                 return
+            elif command == 'ratelimit':
+                await Owner.ratelimit(message, args)
+                return
+            elif command == 'trace':
+                await Owner.trace(message, args)
+                return
+            elif command == 'profile':
+                await Owner.profile(message, args)
+                return
             elif command == 'shutdown':
                 await Owner.shutdown(message)
                 return
@@ -220,6 +441,7 @@ class aclient(discord.AutoShardedClient):
                 await __wrong_selection()
 
     async def on_guild_remove(self, guild):
+        self.counter.remove_guild(guild)
         if not self.synced:
             return
         program_logger.info(f'I got kicked from {guild}. (ID: {guild.id})')
@@ -236,17 +458,22 @@ class aclient(discord.AutoShardedClient):
             program_logger.critical(f"Error fetching owner user: {e}")
             sys.exit(f"Error fetching owner user: {e}")
         discord_logger.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
-        discord_logger.info('Syncing...')
-        await tree.sync()
-        discord_logger.info('Synced.')
+        self.add_dynamic_items(MethodToggle, MethodSubmit)
+        if IS_PRIMARY:
+            discord_logger.info('Syncing...')
+            await tree.sync()
+            discord_logger.info('Synced.')
         self.synced = True
-        self.stats = bot_directory.Stats(bot=bot, logger=program_logger, topgg_token=TOPGG_TOKEN)
+        # In cluster mode only the primary posts, with the counts of every worker.
+        self.stats = DirectoryStats(bot=bot, logger=program_logger, topgg_token=TOPGG_TOKEN) if IS_PRIMARY else None
 
     async def on_ready(self):
+        self.counter.recount(self.guilds)
         await bot.change_presence(activity=self.Presence.get_activity(), status=self.Presence.get_status())
         if self.initialized:
             return
-        self.stats.start_stats_update()
+        if self.stats is not None:
+            self.stats.start_stats_update()
         program_logger.info(r'''
                            _
   /\  /\___ _ __ ___ _   _| | ___  ___
@@ -254,7 +481,19 @@ class aclient(discord.AutoShardedClient):
 / __  /  __/ | | (__| |_| | |  __/\__ \
 \/ /_/ \___|_|  \___|\__,_|_|\___||___/
         ''')
-        bot.loop.create_task(Tasks.health_server())
+        if IS_PRIMARY:
+            bot.loop.create_task(Tasks.health_server())
+            bot.loop.create_task(Tasks.compact_jobs())
+        if CLUSTER_ID is not None:
+            bot.loop.create_task(Tasks.publish_cluster_status())
+        bot.loop.create_task(Tasks.evict_rate_limits())
+        bot.loop.create_task(Tasks.evict_downloads())
+        bot.loop.create_task(Tasks.evict_staged_uploads())
+        bot.loop.create_task(Tasks.probe_api())
+        bot.loop.create_task(Tasks.flush_debug_reports())
+        bot.loop.create_task(Tasks.monitor_shards())
+        bot.loop.create_task(Functions.resume_jobs())
+        Hercules.start_catalog_refresh(CATALOG_REFRESH_INTERVAL)
         global start_time
         start_time = datetime.datetime.now(datetime.UTC)
         program_logger.info(f"Initialization completed in {time.time() - startupTime_start} seconds.")
@@ -284,15 +523,145 @@ class Tasks():
         async def __health_check(request):
             return aiohttp.web.Response(text="Healthy")
 
+        async def __metrics(request):
+            return aiohttp.web.json_response(Functions.collect_metrics())
+
+        async def __ready(request):
+            readiness = Functions.collect_readiness()
+            return aiohttp.web.json_response(readiness, status=503 if readiness['status'] == 'down' else 200)
+
+        async def __shards(request):
+            workers = cluster.read_status(CLUSTER_FOLDER, exclude=CLUSTER_ID) if CLUSTER_ID is not None else {}
+            return aiohttp.web.json_response({
+                "median": shardmonitor.to_ms(shard_monitor.fleet_median(remote=Functions.remote_shard_latencies(workers))),
+                "shards": shard_monitor.snapshot(),
+                "workers": {str(worker): data.get('shard_health', {}) for worker, data in workers.items()},
+            })
+
+        async def __download(request):
+            download = download_store.get(request.match_info['token'])
+            if download is None:
+                raise aiohttp.web.HTTPNotFound()
+            filename = download.filename.replace('"', '')
+            # FileResponse streams with sendfile and answers Range requests.
+            return aiohttp.web.FileResponse(download.path, headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'Content-Type': 'application/octet-stream',
+                'Cache-Control': 'private, no-store',
+            })
+
         app = aiohttp.web.Application()
         app.router.add_get('/health', __health_check)
-        runner = aiohttp.web.AppRunner(app)
-        await runner.setup()
-        site = aiohttp.web.TCPSite(runner, '0.0.0.0', 5000)
-        try:
-            await site.start()
-        except OSError as e:
-            program_logger.warning(f'Error while starting health server: {e}')
+        app.router.add_get('/download/{token}', __download)
+        internal_app = aiohttp.web.Application()
+        internal_app.router.add_get('/metrics', __metrics)
+        internal_app.router.add_get('/ready', __ready)
+        internal_app.router.add_get('/shards', __shards)
+        for name, application, host, port in (('health', app, '0.0.0.0', HEALTH_PORT), ('metrics', internal_app, METRICS_HOST, METRICS_PORT)):
+            runner = aiohttp.web.AppRunner(application)
+            await runner.setup()
+            site = aiohttp.web.TCPSite(runner, host, port)
+            try:
+                await site.start()
+            except OSError as e:
+                program_logger.warning(f'Error while starting {name} server: {e}')
+
+    async def publish_cluster_status():
+        while True:
+            cluster.write_status(CLUSTER_FOLDER, CLUSTER_ID, {
+                "guilds": bot.counter.guilds,
+                "members": bot.counter.members,
+                "shards": SHARD_IDS,
+                "active_jobs": drain.active,
+                "draining": drain.draining,
+                "shard_health": shard_monitor.summary(),
+                "connections": Functions.shard_connections(),
+            })
+            workers = cluster.read_status(CLUSTER_FOLDER, exclude=CLUSTER_ID)
+            bot.counter.remote_guilds = sum(worker['guilds'] for worker in workers.values())
+            bot.counter.remote_members = sum(worker['members'] for worker in workers.values())
+            await asyncio.sleep(30)
+
+    async def probe_api():
+        while True:
+            try:
+                reachable, latency = await Hercules.ping()
+            except Exception as e:
+                program_logger.debug(f'API probe failed: {e}')
+                reachable, latency = False, None
+            if reachable != _api_probe['reachable']:
+                program_logger.info(f"Hercules API is {'reachable' if reachable else 'unreachable'}.")
+            _api_probe.update(reachable=reachable, latency=round(latency * 1000, 2) if reachable else None, checked=time.time())
+            await asyncio.sleep(READY_PROBE_INTERVAL)
+
+    async def monitor_shards():
+        while True:
+            await asyncio.sleep(SHARD_MONITOR_INTERVAL)
+            for shard_id, shard in bot.shards.items():
+                if not shard.is_closed():
+                    shard_monitor.record_latency(shard_id, shard.latency)
+            if CLUSTER_ID is not None:
+                remote = Functions.remote_shard_latencies(await asyncio.to_thread(cluster.read_status, CLUSTER_FOLDER, CLUSTER_ID))
+            else:
+                remote = []
+            for shard_id in shard_monitor.outliers(remote):
+                shard = bot.get_shard(shard_id)
+                if shard is None or shard.is_closed():
+                    continue
+                program_logger.warning(f'Shard {shard_id} is lagging ({shard.latency * 1000:.0f}ms, median of the other shards {shardmonitor.to_ms(shard_monitor.fleet_median(shard_id, remote))}ms), reconnecting it.')
+                try:
+                    await shard.reconnect()
+                except Exception as e:
+                    program_logger.warning(f'Error while reconnecting shard {shard_id} -> {e}')
+
+    async def evict_downloads():
+        while True:
+            await asyncio.sleep(60)
+            removed = download_store.evict_expired()
+            if removed:
+                program_logger.debug(f'Removed {removed} expired downloads.')
+
+    async def evict_rate_limits():
+        while True:
+            await asyncio.sleep(300)
+            evicted = rate_limiter.evict_idle()
+            if evicted:
+                program_logger.debug(f'Evicted {evicted} idle rate limit buckets.')
+
+    async def compact_jobs():
+        while True:
+            await asyncio.sleep(300)
+            removed = job_store.compact(JOB_TOKEN_TTL)
+            if removed:
+                program_logger.debug(f'Compacted {removed} jobs from the journal.')
+
+    async def evict_staged_uploads():
+        # Every worker stages its own uploads, unlike the shared journal which only the primary compacts.
+        while True:
+            await asyncio.sleep(300)
+            for job_id, (started, task) in list(_staged_uploads.items()):
+                if time.time() - started > job_store.ttl:
+                    task.cancel()
+                    del _staged_uploads[job_id]
+
+    async def flush_debug_reports():
+        while True:
+            await asyncio.sleep(DEBUG_REPORT_FLUSH_INTERVAL)
+            debug_reporter.evict()
+            for report in debug_reporter.pending():
+                report.dirty = False
+                try:
+                    await report.message.edit(content=Functions.debug_report_content(report))
+                except discord.NotFound:
+                    debug_reporter.discard(report)
+                except discord.HTTPException as e:
+                    report.dirty = True
+                    program_logger.warning(f'Error while updating debug report summary -> {e}')
+
+
+_botinfo_cache: Optional[Tuple[float, discord.Embed]] = None
+_api_probe = {'reachable': None, 'latency': None, 'checked': 0.0}
+_staged_uploads: dict[str, Tuple[float, asyncio.Task]] = {}
 
 
 class Functions():
@@ -314,7 +683,99 @@ class Functions():
                 pass
         return item_object
 
-    async def is_valid_url_and_lua_syntax(url: str) -> Tuple[bool, str]:
+    def collect_metrics() -> dict:
+        return {
+            "ratelimit": rate_limiter.snapshot(),
+            "jobs": {"active": drain.active, "draining": drain.draining},
+            "debug_reports": debug_reporter.snapshot(),
+            "downloads": download_store.snapshot(),
+            "memory_budget": memory_budget.snapshot(),
+            "api_limits": Hercules.limits_snapshot(),
+            "cost_model": cost_model.snapshot(),
+            "cluster": {"worker": CLUSTER_ID, "workers": cluster.read_status(CLUSTER_FOLDER) if CLUSTER_ID is not None else {}},
+        }
+
+    def shard_connections() -> dict:
+        return {
+            str(shard_id): {"connected": not shard.is_closed(), "latency": round(shard.latency * 1000, 2) if shard.latency != float('inf') else None}
+            for shard_id, shard in bot.shards.items()
+        }
+
+    def collect_readiness() -> dict:
+        """Readiness from cached state only, a scrape never reaches the Hercules API."""
+        problems = []
+        probe_age = time.time() - _api_probe['checked']
+        api_stale = probe_age > READY_PROBE_INTERVAL * 3
+        if _api_probe['reachable'] is False:
+            problems.append(('down', 'api unreachable'))
+        elif api_stale:
+            problems.append(('degraded', 'api probe stale'))
+
+        shards = Functions.shard_connections()
+        active = drain.active
+        if CLUSTER_ID is not None:
+            # The other workers as of their last status file. The shards of a worker that stopped reporting count as disconnected.
+            workers = cluster.read_status(CLUSTER_FOLDER, exclude=CLUSTER_ID)
+            for worker, data in workers.items():
+                for shard_id, connection in data.get('connections', {}).items():
+                    shards[shard_id] = {**connection, "worker": worker}
+                active += data.get('active_jobs', 0)
+                if data.get('draining'):
+                    problems.append(('degraded', f'worker {worker} draining'))
+            for shard_id in range(SHARD_COUNT or 0):
+                shards.setdefault(str(shard_id), {"connected": False, "latency": None})
+        disconnected = sum(not shard['connected'] for shard in shards.values())
+        if not shards or disconnected / len(shards) >= READY_DOWN_THRESHOLD:
+            problems.append(('down', f'{disconnected}/{len(shards)} shards disconnected'))
+        elif disconnected:
+            problems.append(('degraded', f'{disconnected}/{len(shards)} shards disconnected'))
+
+        saturation = active / READY_MAX_ACTIVE_JOBS
+        if drain.draining:
+            problems.append(('down', 'draining'))
+        elif saturation >= 1:
+            problems.append(('degraded', 'job queue saturated'))
+
+        status = 'down' if any(level == 'down' for level, _ in problems) else 'degraded' if problems else 'ok'
+        return {
+            "status": status,
+            "problems": [problem for _, problem in problems],
+            "api": {**_api_probe, "age": round(probe_age, 1)},
+            "shards": shards,
+            "jobs": {"active": active, "limit": READY_MAX_ACTIVE_JOBS, "saturation": round(saturation, 2), "draining": drain.draining},
+        }
+
+    async def check_accepting(interaction: discord.Interaction) -> bool:
+        if not drain.draining:
+            return True
+        await interaction.edit_original_response(content="Hercules is restarting right now. Please try again in a minute.")
+        return False
+
+    async def check_rate_limit(interaction: discord.Interaction, size: int = 0) -> bool:
+        retry_after = rate_limiter.acquire(interaction.user.id, interaction.guild_id, size)
+        if retry_after <= 0:
+            return True
+        retry_at = int(time.time() + retry_after) + 1
+        await interaction.edit_original_response(content=f"You are obfuscating too much right now.\nTry again in `{retry_after:.1f}s` (<t:{retry_at}:R>).")
+        return False
+
+    async def reserve_memory(interaction: discord.Interaction, nbytes: int) -> Optional[int]:
+        try:
+            return await memory_budget.acquire(nbytes, MEMORY_BUDGET_WAIT)
+        except membudget.BudgetExceeded:
+            await interaction.edit_original_response(content="Hercules is busy with too many large files right now. Please try again in a minute.")
+            return None
+
+    async def validate_lua(code: str, trace: tracing.Trace = None) -> Tuple[bool, str]:
+        trace = trace or tracing.Trace('validate')
+        with trace.span('precheck'):
+            isValid, conout = await asyncio.to_thread(lua_precheck.precheck, code)
+        if not isValid:
+            return False, conout
+        with drain.track(), trace.span('validate'):
+            return await Hercules.isValidLUASyntax(code)
+
+    async def is_valid_url_and_lua_syntax(url: str, trace: tracing.Trace = None) -> Tuple[bool, str]:
         url = unquote(url)
 
         url_pattern = re.compile(
@@ -339,8 +800,12 @@ class Functions():
                 async with session.get(url) as response:
                     if response.status not in [200, 204, 301, 302]:
                         return False, f"HTTP Error: {response.status}"
+                    if trace is not None:
+                        trace.begin('download')
                     lua_code = await response.text()
-                    isValid, conout = await Hercules.isValidLUASyntax(lua_code)
+                    if trace is not None:
+                        trace.end('download')
+                    isValid, conout = await Functions.validate_lua(lua_code, trace)
                     if isValid:
                         return True, lua_code
                     else:
@@ -349,25 +814,430 @@ class Functions():
             program_logger.error(f"Error fetching URL: {e}")
             return False, "URL not reachable."
 
-    async def send_file(interaction: discord.Interaction, file_path: str):
+    def upload_limit(interaction: discord.Interaction) -> int:
+        guild = getattr(interaction, 'guild', None)
+        return max(guild.filesize_limit, DISCORD_UPLOAD_LIMIT) if guild is not None else DISCORD_UPLOAD_LIMIT
+
+    def input_size(job: jobs.Job) -> int:
+        input_path = job_store.input_path(job)
+        if not os.path.exists(input_path):
+            return 0
+        return archive.content_size(input_path) if job.kind == 'archive' else os.path.getsize(input_path)
+
+    def delivery_plan(interaction: discord.Interaction, job: jobs.Job, selected_bits: int, input_size: int) -> str:
+        """How the output will be sent, decided from its expected size before the job runs."""
+        estimate = cost_model.estimate(input_size, selected_bits)
+        if estimate is None:
+            return 'raw'
+        plan = cost_model.delivery(estimate.output_size, Functions.upload_limit(interaction), bool(PUBLIC_URL))
+        # An archive job already delivers a zip file.
+        return 'raw' if plan == 'zip' and job.kind == 'archive' else plan
+
+    def estimate_text(interaction: discord.Interaction, job: jobs.Job, selected_bits: int) -> str:
+        if not selected_bits:
+            return ''
+        input_size = Functions.input_size(job)
+        estimate = cost_model.estimate(input_size, selected_bits)
+        if estimate is None:
+            return ''
+        delivery = {
+            'raw': 'as a file',
+            'zip': 'as a zip file',
+            'link': 'as a download link',
+        }[Functions.delivery_plan(interaction, job, selected_bits, input_size)]
+        return f"\n-# Estimated time: ~{max(1, round(estimate.duration))}s, output ~{estimate.output_size / 1024:,.0f} KiB, sent {delivery}."
+
+    def selection_content(interaction: discord.Interaction, job: jobs.Job, selected_bits: int, content: str = None) -> str:
+        """The selection message with an estimate for the current selection. Without `content` the estimate of the
+        message the interaction belongs to is replaced."""
+        if content is None:
+            content = interaction.message.content.split('\n-# Estimated')[0]
+        return content + Functions.estimate_text(interaction, job, selected_bits)
+
+    async def send_file(interaction: discord.Interaction, file_path: str, plan: str = 'raw'):
+        size = os.path.getsize(file_path)
+        limit = Functions.upload_limit(interaction)
+        if plan == 'raw' and size > limit:
+            plan = cost_model.delivery(size, limit, bool(PUBLIC_URL))
         try:
-            await interaction.followup.send(f"{interaction.user.mention}\nObfuscation complete!", file=discord.File(file_path), ephemeral=True)
-        except discord.HTTPException as err:
-            if err.status == 413:
-                zip_file = f'{BUFFER_FOLDER}{interaction.user.id}_{randrange(0, 9999)}.zip'
-                with ZipFile(zip_file, mode='w', compression=ZIP_DEFLATED, compresslevel=9, allowZip64=True) as f:
-                    f.write(file_path)
+            if plan == 'raw':
+                try:
+                    await interaction.followup.send(f"{interaction.user.mention}\nObfuscation complete!", file=discord.File(file_path), ephemeral=True)
+                    return
+                except discord.HTTPException as err:
+                    if err.status != 413:
+                        return
+            zip_file = f'{BUFFER_FOLDER}{interaction.user.id}_{randrange(0, 9999)}.zip'
+            with ZipFile(zip_file, mode='w', compression=ZIP_DEFLATED, compresslevel=9, allowZip64=True) as f:
+                f.write(file_path)
+            cost_model.record_compression(size, os.path.getsize(zip_file))
+            if plan != 'link':
                 try:
                     await interaction.followup.send(f"{interaction.user.mention}\nObfuscation complete!", file=discord.File(zip_file), ephemeral=True)
+                    return
                 except discord.HTTPException as err:
-                    if err.status == 413:
-                        await interaction.followup.send(f"{interaction.user.mention}\nObfuscation complete! The file is too big to be sent directly.")
+                    if err.status != 413:
+                        return
+            download = download_store.add(zip_file, f'{os.path.splitext(os.path.basename(file_path))[0]}.zip') if PUBLIC_URL else None
+            if download is None:
+                await interaction.followup.send(f"{interaction.user.mention}\nObfuscation complete! The file is too big to be sent directly.")
+            else:
+                await interaction.followup.send(f"{interaction.user.mention}\nObfuscation complete! The file is too big for Discord, download it here: {PUBLIC_URL}/download/{download.token}\nThe link expires <t:{int(download.expires)}:R>.", ephemeral=True)
         finally:
             if os.path.exists(file_path):
                 os.remove(file_path)
             if 'zip_file' in locals() and os.path.exists(zip_file):
                 os.remove(zip_file)
 
+    def get_botinfo_embed() -> discord.Embed:
+        global _botinfo_cache
+        now = time.monotonic()
+        if _botinfo_cache is None or now - _botinfo_cache[0] > BOTINFO_CACHE_TTL:
+            embed = discord.Embed(
+                title=f"Information about {bot.user.name}",
+                color=discord.Color.blue()
+            )
+            embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else '')
+
+            embed.add_field(name="Created at", value=bot.user.created_at.strftime("%d.%m.%Y, %H:%M:%S"), inline=True)
+            embed.add_field(name="Bot-Version", value=BOT_VERSION, inline=True)
+            embed.add_field(name="Uptime", value="\u200b", inline=True)
+
+            embed.add_field(name="Bot-Owner", value=f"<@!{OWNERID}>", inline=True)
+            embed.add_field(name="\u200b", value="\u200b", inline=True)
+            embed.add_field(name="\u200b", value="\u200b", inline=True)
+
+            embed.add_field(name="Server", value=f"{bot.counter.total_guilds}", inline=True)
+            embed.add_field(name="Member count", value=str(bot.counter.total_members), inline=True)
+            embed.add_field(name="\u200b", value="\u200b", inline=True)
+
+            embed.add_field(name="Shards", value=f"{bot.shard_count}", inline=True)
+            embed.add_field(name="Shard ID", value="\u200b", inline=True)
+            embed.add_field(name="\u200b", value="\u200b", inline=True)
+
+            embed.add_field(name="Python-Version", value=f"{platform.python_version()}", inline=True)
+            embed.add_field(name="discord.py-Version", value=f"{discord.__version__}", inline=True)
+            embed.add_field(name="Sentry-Version", value=f"{sentry_sdk.consts.VERSION}", inline=True)
+
+            embed.add_field(name="Repo", value=f"[GitHub](https://github.com/Serpensin/DiscordBots-Hercules)", inline=True)
+            embed.add_field(name="Invite", value=f"[Invite me](https://discord.com/oauth2/authorize?client_id={bot.user.id})", inline=True)
+            embed.add_field(name="\u200b", value="\u200b", inline=True)
+            _botinfo_cache = (now, embed)
+        return _botinfo_cache[1].copy()
+
+    def remote_shard_latencies(workers: dict) -> list:
+        """Latest latency in seconds of every connected shard the other cluster workers published."""
+        return [
+            data['last'] / 1000
+            for worker in workers.values()
+            for data in worker.get('shard_health', {}).values()
+            if data.get('last') is not None and data.get('connected', True)
+        ]
+
+    def shard_health_text(limit: int = 10) -> str:
+        """The `limit` slowest shards of this process, for the owner view of /botinfo."""
+        summary = shard_monitor.summary()
+        if not summary:
+            return 'No samples yet.'
+        slowest = sorted(summary.items(), key=lambda item: item[1]['last'] if item[1]['last'] is not None else float('inf'), reverse=True)[:limit]
+        lines = [f"#{shard_id}: {data['last']}ms (p50 {data['p50']}ms, max {data['max']}ms), {data['reconnects']} reconnects" for shard_id, data in slowest]
+        if len(summary) > limit:
+            lines.append(f"... {len(summary) - limit} more, see /shards on the health server.")
+        return '\n'.join(lines)
+
+    def decode_lua(raw: bytes) -> str:
+        if raw.startswith(b'\xef\xbb\xbf'):
+            return raw.decode('utf-8-sig')
+        elif raw.startswith(b'\xff\xfe\x00\x00'):
+            return raw.decode('utf-32-le')
+        elif raw.startswith(b'\x00\x00\xfe\xff'):
+            return raw.decode('utf-32-be')
+        elif raw.startswith(b'\xff\xfe'):
+            return raw.decode('utf-16-le')
+        elif raw.startswith(b'\xfe\xff'):
+            return raw.decode('utf-16-be')
+        for encoding in ['utf8', 'cp1252', 'latin-1']:
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return raw.decode('utf-8', errors='replace')
+
+    async def send_text_report(interaction: discord.Interaction, content: str, report: str, filename: str):
+        with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
+            temp_file.write(report)
+            temp_file_path = temp_file.name
+        try:
+            await interaction.followup.send(content=content, file=discord.File(temp_file_path, filename=filename), ephemeral=True)
+        finally:
+            os.remove(temp_file_path)
+
+    async def read_archive(interaction: discord.Interaction, file: discord.Attachment) -> Optional[Tuple[list, list]]:
+        if file.size > MAX_ARCHIVE_SIZE:
+            await interaction.edit_original_response(content=f"The archive is too big. Please upload an archive smaller than {MAX_ARCHIVE_SIZE // (1024 * 1024)} MB.")
+            return None
+
+        # Read from memory: the upload is already loaded and a shared buffer path would collide between jobs.
+        try:
+            files, skipped = await asyncio.to_thread(archive.extract_lua_files, io.BytesIO(await file.read()))
+        except archive.ArchiveError as e:
+            await interaction.edit_original_response(content=f"The archive could not be read: {e}")
+            return None
+
+        if not files:
+            await interaction.edit_original_response(content="The archive does not contain any usable `.lua` files.")
+            if skipped:
+                await Functions.send_text_report(interaction, "Skipped files:", archive.format_report(skipped), 'errors.txt')
+            return None
+        return [(name, Functions.decode_lua(data)) for name, data in files], skipped
+
+    async def validate_many(files: list) -> Tuple[list, list]:
+        semaphore = asyncio.Semaphore(ARCHIVE_CONCURRENCY)
+
+        async def __validate(name, code):
+            async with semaphore:
+                return await Functions.validate_lua(code)
+
+        results = await asyncio.gather(*(__validate(name, code) for name, code in files))
+        valid = []
+        errors = []
+        for (name, code), (isValid, conout) in zip(files, results):
+            if isValid:
+                valid.append((name, code))
+            else:
+                errors.append((name, conout))
+        return valid, errors
+
+    async def obfuscate_many(prefix: str, files: list, selected_bits: int) -> Tuple[list, list]:
+        semaphore = asyncio.Semaphore(ARCHIVE_CONCURRENCY)
+
+        async def __obfuscate(idx, code):
+            async with semaphore:
+                success, conout, duration = await Hercules.obfuscate_code(code, selected_bits, f'{prefix}_{idx}')
+                if success:
+                    cost_model.record(len(code.encode('utf-8')), selected_bits, duration, len(conout))
+                return success, conout
+
+        results = await asyncio.gather(*(__obfuscate(idx, code) for idx, (name, code) in enumerate(files)))
+        await asyncio.to_thread(cost_model.save)
+        outputs = []
+        errors = []
+        for (name, code), (success, conout) in zip(files, results):
+            if success:
+                outputs.append((name, conout))
+            else:
+                errors.append((name, conout))
+        return outputs, errors
+
+    async def obfuscate_archive(interaction: discord.Interaction, file: discord.Attachment, optional_preset: str = None):
+        limits = archive.ArchiveLimits()
+        reserved = await Functions.reserve_memory(interaction, min(file.size * limits.max_ratio, limits.max_total_size) * 2)
+        if reserved is None:
+            return
+        trace = tracer.start('archive')
+        try:
+            with trace.span('download'):
+                entries = await Functions.read_archive(interaction, file)
+            if entries is None:
+                tracer.finish(trace, 'invalid')
+                return
+            files, errors = entries
+
+            with trace.span('validate'):
+                valid, invalid = await Functions.validate_many(files)
+        finally:
+            await memory_budget.release(reserved)
+        errors += invalid
+        if not valid:
+            tracer.finish(trace, 'invalid')
+            await interaction.edit_original_response(content="None of the files in the archive contain valid Lua syntax.")
+            await Functions.send_text_report(interaction, "Details:", archive.format_report(errors), 'errors.txt')
+            return
+
+        job = jobs.Job(job_store.new_id(), interaction.user.id, interaction.guild_id, 'archive', file.filename, errors=[list(error) for error in errors])
+        with trace.span('pack'):
+            await asyncio.to_thread(archive.build_archive, job_store.input_path(job), [(name, code.encode('utf-8')) for name, code in valid])
+        job_store.save(job)
+        tracer.bind(trace, job.job_id)
+        await Functions.start_selection(interaction, job, optional_preset, f"Please select the obfuscation methods you want to use for {file.filename} ({len(valid)} files).")
+
+    async def check_archive(interaction: discord.Interaction, file: discord.Attachment):
+        limits = archive.ArchiveLimits()
+        reserved = await Functions.reserve_memory(interaction, min(file.size * limits.max_ratio, limits.max_total_size) * 2)
+        if reserved is None:
+            return
+        try:
+            entries = await Functions.read_archive(interaction, file)
+            if entries is None:
+                return
+            files, errors = entries
+
+            valid, invalid = await Functions.validate_many(files)
+        finally:
+            await memory_budget.release(reserved)
+        errors += invalid
+        if not invalid:
+            await interaction.followup.send(content=f"All {len(valid)} files in the archive contain valid Lua syntax.")
+        else:
+            await Functions.send_text_report(interaction, f"{len(invalid)} of {len(files)} files in the archive do not contain valid Lua syntax.", archive.format_report(errors), 'errors.txt')
+
+    def preset_bits(preset_name: Optional[str] = None) -> int:
+        return Hercules.catalog.bits_for_preset(preset_name)
+
+    def method_view(job_id: str, selected_bits: int) -> discord.ui.View:
+        view = discord.ui.View(timeout=None)
+        view.add_item(MethodSubmit(job_id, selected_bits))
+        for idx, method in enumerate(Hercules.catalog.methods):
+            view.add_item(MethodToggle(
+                job_id,
+                selected_bits,
+                method['bitkey'],
+                label=method['name'],
+                disabled=not method['enabled'],
+                row=(idx // 5) + 1
+            ))
+        # The view is never stored in memory; clicks are routed through the dynamic items registered in setup_hook.
+        view.stop()
+        return view
+
+    async def start_selection(interaction: discord.Interaction, job: jobs.Job, optional_preset: str, content: str):
+        Functions.stage_input(job)
+        trace = tracer.get(job.job_id)
+        # Ended by MethodSubmit, the time the user needs to pick is not service time.
+        trace.begin('select', idle=True)
+        selected_bits = Functions.preset_bits(optional_preset or None)
+        content = await asyncio.to_thread(Functions.selection_content, interaction, job, selected_bits, content)
+        if PERSISTENT_COMPONENTS:
+            await interaction.edit_original_response(content=content, view=Functions.method_view(job.job_id, selected_bits))
+            return
+
+        view = ModeSelectionView(job, selected_bits)
+        await interaction.edit_original_response(content=content, view=view)
+        await view.wait()
+        trace.end('select')
+        job_store.submit(job, view.selected_bits, interaction.application_id, interaction.token)
+        await Functions.run_job(interaction, job)
+
+    def stage_input(job: jobs.Job):
+        """Upload the input to the API while the user is still picking methods."""
+        if job.kind == 'archive' or not Hercules.staging_supported:
+            return
+
+        async def __stage():
+            with open(job_store.input_path(job), 'r', encoding='utf8') as f:
+                code = f.read()
+            return await Hercules.stage(code, job.input_hash)
+
+        _staged_uploads[job.job_id] = (time.time(), asyncio.create_task(__stage()))
+
+    async def staged_handle(job: jobs.Job) -> Optional[str]:
+        entry = _staged_uploads.pop(job.job_id, None)
+        if entry is None:
+            return None
+        try:
+            return await entry[1]
+        except Exception as e:
+            program_logger.debug(f'Staging {job.job_id} failed: {e}')
+            return None
+
+    async def run_job(interaction: discord.Interaction, job: jobs.Job):
+        if job.state != 'delivering':
+            job_store.set_state(job, 'running')
+        trace = tracer.get(job.job_id)
+        success = False
+        estimate = await asyncio.to_thread(Functions.input_size, job)
+        # A job resumed while delivering already has its output, send_file picks the way from its size.
+        plan = Functions.delivery_plan(interaction, job, job.bitmask, estimate) if job.state != 'delivering' else 'raw'
+        with drain.track():
+            reserved = 0
+            abandoned = False
+            try:
+                # A submitted job is never rejected, it waits until enough of the budget is free.
+                with trace.span('memory_wait'):
+                    reserved = await memory_budget.acquire(estimate * membudget.OBFUSCATE_FACTOR)
+                if job.kind == 'archive':
+                    success = await Functions.run_archive_job(interaction, job, trace, plan)
+                else:
+                    success = await Functions.run_file_job(interaction, job, trace, plan)
+            except asyncio.CancelledError:
+                # Cancelled by a shutdown past the drain deadline: the job stays in the journal and is resumed.
+                abandoned = drain.draining
+                raise
+            finally:
+                await memory_budget.release(reserved)
+                if abandoned:
+                    tracer.finish(trace, 'abandoned')
+                else:
+                    job_store.finish(job, 'done' if success else 'failed')
+                    tracer.finish(trace, 'done' if success else 'failed')
+
+    async def run_file_job(interaction: discord.Interaction, job: jobs.Job, trace: tracing.Trace, plan: str = 'raw') -> bool:
+        file_path = job_store.input_path(job)
+        if job.state != 'delivering':
+            with open(file_path, 'r', encoding='utf8') as f:
+                original_code = f.read()
+
+            with trace.span('stage_wait'):
+                handle = await Functions.staged_handle(job)
+            input_size = os.path.getsize(file_path)
+            with trace.span('obfuscate'):
+                success, conout, duration = await Hercules.obfuscate(file_path, job.bitmask, job.job_id, handle)
+            if success:
+                # Hercules.obfuscate replaced the input with the result, so a resumed job only has to deliver it.
+                # Persisted before the next await, a shutdown in between must not obfuscate the output again.
+                job_store.set_state(job, 'delivering')
+                cost_model.record(input_size, job.bitmask, duration, os.path.getsize(file_path))
+                await asyncio.to_thread(cost_model.save)
+            else:
+                view = AskSendDebug()
+
+                with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
+                    temp_file.write(conout)
+                    temp_file_path = temp_file.name
+
+                message = await interaction.followup.send(f"{interaction.user.mention}\nObfuscation failed. Please try again.\nSend the original file to the owner for debug?", file=discord.File(temp_file_path, filename='Error.txt'), view=view, ephemeral=True)
+                await interaction.delete_original_response()
+                view.message = message
+                view.error_text = conout
+                view.original_code = original_code
+                with trace.span('debug_prompt', idle=True):
+                    await view.wait()
+                os.remove(temp_file_path)
+                return False
+
+        with trace.span('deliver'):
+            await Functions.send_file(interaction, file_path, plan)
+        return True
+
+    async def run_archive_job(interaction: discord.Interaction, job: jobs.Job, trace: tracing.Trace, plan: str = 'raw') -> bool:
+        name = os.path.splitext(os.path.basename(job.name))[0]
+        zip_path = os.path.abspath(f'{BUFFER_FOLDER}{job.job_id}_{name}_obfuscated.zip')
+        if job.state != 'delivering' or not os.path.exists(zip_path):
+            with trace.span('extract'):
+                files, _ = await asyncio.to_thread(archive.extract_lua_files, job_store.input_path(job))
+            with trace.span('obfuscate'):
+                outputs, failed = await Functions.obfuscate_many(job.job_id, [(name, data.decode('utf-8')) for name, data in files], job.bitmask)
+            errors = [tuple(error) for error in job.errors] + failed
+            if not outputs:
+                await interaction.followup.send(f"{interaction.user.mention}\nObfuscation failed for every file in the archive. Please try again.", ephemeral=True)
+                await Functions.send_text_report(interaction, "Details:", archive.format_report(errors), 'errors.txt')
+                return False
+
+            with trace.span('pack'):
+                await asyncio.to_thread(archive.build_archive, zip_path, outputs, archive.format_report(errors) if errors else None)
+            job_store.set_state(job, 'delivering')
+
+        with trace.span('deliver'):
+            await Functions.send_file(interaction, zip_path, plan)
+        return True
+
+    async def resume_jobs():
+        pending = job_store.resumable(JOB_TOKEN_TTL)
+        if not pending:
+            return
+        program_logger.info(f'Resuming {len(pending)} jobs from the journal.')
+        await asyncio.gather(*(Functions.run_job(ResumedInteraction(job), job) for job in pending), return_exceptions=True)
+
     async def create_support_invite(interaction):
         try:
             guild = bot.get_guild(int(SUPPORTID))
@@ -405,43 +1275,33 @@ class Functions():
                 continue
         return "Could not create invite. There is either no text-channel, or I don't have the rights to create an invite."
 
-    async def send_debug_files(interaction: discord.Interaction, error_text: str, original_code: str) -> bool:
-        temp_file_path = ''
-        to_send = None
-        file_url = os.path.abspath(f'{BUFFER_FOLDER}{interaction.user.id}_url.lua')
-        file_file = os.path.abspath(f'{BUFFER_FOLDER}{interaction.user.id}_file.lua')
-
-        if os.path.exists(file_url):
-            to_send = file_url
-        elif os.path.exists(file_file):
-            to_send = file_file
-        else:
-            return False
-
-        with tempfile.NamedTemporaryFile(suffix=".lua", delete=False, encoding='utf-8', mode='w') as original_temp:
-            original_temp.write(original_code)
-            orig_file_path = original_temp.name
-
-        channel: discord.TextChannel = await Functions.get_or_fetch('channel', DEBUG_CHANNEL_ID)
+    def debug_report_content(report: debugreport.DebugReport) -> str:
+        content = f"A error appeared during/after obfuscation, executed by <@{report.user_id}>.:\n"
+        if report.count > 1:
+            content += f"Hit {report.count} times by {len(report.users)} users, last <t:{int(report.last_seen)}:R>.\n"
+        if len(report.error_text) <= DEBUG_INLINE_LIMIT:
+            content += f"```txt\n{report.error_text}```"
+        return content
 
+    async def send_debug_files(interaction: discord.Interaction, error_text: str, original_code: str) -> bool:
+        code = original_code.encode('utf-8')
+        report, new = debug_reporter.record(interaction.user.id, error_text, code)
+        if not new:
+            program_logger.debug(f'Merged debug report {report.fingerprint[0]} from {interaction.user.id} ({report.count} reports).')
+            # The first report of this failure may still be on its way, or failed to send.
+            return report.message is not None
+
+        files = [discord.File(io.BytesIO(code), filename='Input.lua')]
+        if len(error_text) > DEBUG_INLINE_LIMIT:
+            files.insert(0, discord.File(io.BytesIO(error_text.encode('utf-8')), filename='ErrorMessage.txt'))
         try:
-            if len(error_text) > 1900:
-                with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
-                    temp_file.write(error_text)
-                    temp_file_path = temp_file.name
-                await channel.send(content=f"A error appeared during/after obfuscation, executed by {interaction.user.mention}.:\n", files=[discord.File(temp_file_path, filename='ErrorMessage.txt'), discord.File(orig_file_path, filename='Input.lua'), discord.File(to_send, filename='Output.lua')])
-                return True
-            else:
-                await channel.send(content=f"A error appeared during/after obfuscation, executed by {interaction.user.mention}.:\n```txt\n{error_text}```", files=[discord.File(orig_file_path, filename='Input.lua'), discord.File(to_send, filename='Output.lua')])
-                return True
+            channel: discord.TextChannel = await Functions.get_or_fetch('channel', DEBUG_CHANNEL_ID)
+            report.message = await channel.send(content=Functions.debug_report_content(report), files=files)
+            return True
         except discord.errors.DiscordException as e:
             program_logger.error(f'Error while sending debug files -> {e}')
+            debug_reporter.discard(report)
             return False
-        finally:
-            os.remove(orig_file_path)
-            os.remove(to_send)
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
 
 
 class Owner():
@@ -449,6 +1309,7 @@ class Owner():
         async def __wrong_selection():
             await message.channel.send('```'
                                        'log [current/folder/lines] (Replace lines with a positive number, if you only want lines.) - Get the log\n'
+                                       'log recent [lines] - Get the most recent records from memory\n'
                                        '```')
         if not args:
             await __wrong_selection()
@@ -456,7 +1317,7 @@ class Owner():
 
         command = args[0]
         if command == 'current':
-            log_file_path = f'{LOG_FOLDER}{BOT_NAME}.log'
+            log_file_path = f'{LOG_FOLDER}{LOG_NAME}.log'
             try:
                 await message.channel.send(file=discord.File(log_file_path))
             except discord.HTTPException as err:
@@ -488,6 +1349,16 @@ class Owner():
             os.remove(zip_path)
             return
 
+        if command == 'recent':
+            try:
+                lines = int(args[1]) if len(args) > 1 else None
+            except ValueError:
+                await __wrong_selection()
+                return
+            records = queue_logging.ring.recent(lines)
+            await message.channel.send(content=f'Here are the last {len(records)} log records:', file=discord.File(io.BytesIO('\n'.join(records).encode('utf-8')), filename='log-recent.txt'))
+            return
+
         try:
             lines = int(command)
             if lines < 1:
@@ -497,10 +1368,10 @@ class Owner():
             await __wrong_selection()
             return
 
-        log_file_path = f'{LOG_FOLDER}{BOT_NAME}.log'
+        log_file_path = f'{LOG_FOLDER}{LOG_NAME}.log'
         buffer_file_path = f'{BUFFER_FOLDER}log-lines.txt'
         with open(log_file_path, 'r', encoding='utf8') as log_file:
-            log_lines = log_file.readlines()[-lines:]
+            log_lines = collections.deque(log_file, maxlen=lines)
         with open(buffer_file_path, 'w', encoding='utf8') as buffer_file:
             buffer_file.writelines(log_lines)
         await message.channel.send(content=f'Here are the last {len(log_lines)} lines of the current logfile:', file=discord.File(buffer_file_path))
@@ -591,6 +1462,93 @@ class Owner():
         await bot.change_presence(activity=bot.Presence.get_activity(), status=bot.Presence.get_status())
         await message.channel.send(f'Status set to {action}.')
 
+    async def ratelimit(message, args):
+        async def __wrong_selection():
+            await message.channel.send('```'
+                                       'ratelimit show - Show the current buckets\n'
+                                       'ratelimit [user/guild/global] [capacity] [tokens per second] - Change a limit\n'
+                                       '```')
+
+        if not args:
+            await __wrong_selection()
+            return
+        if args[0].lower() == 'show':
+            await message.channel.send(f'```json\n{json.dumps(rate_limiter.snapshot(), indent=2)}```')
+            return
+        if len(args) != 3:
+            await __wrong_selection()
+            return
+        try:
+            rate_limiter.configure(args[0].lower(), float(args[1]), float(args[2]))
+        except ValueError as e:
+            await message.channel.send(str(e))
+            await __wrong_selection()
+            return
+        program_logger.info(f'Rate limit for {args[0].lower()} set to {args[1]} tokens, {args[2]} tokens/s.')
+        await message.channel.send(f'Rate limit for {args[0].lower()} set to {args[1]} tokens, refilling {args[2]} tokens per second.')
+
+    async def trace(message, args):
+        async def __wrong_selection():
+            await message.channel.send('```'
+                                       'trace recent - List the last jobs\n'
+                                       'trace stats - Per-stage percentiles of the last jobs\n'
+                                       'trace [job id] - Show the stage waterfall of a job\n'
+                                       '```')
+
+        if not args:
+            await __wrong_selection()
+            return
+        if args[0].lower() == 'recent':
+            text = '\n'.join(
+                f"{trace.job_id or '-':<12} {trace.kind:<8} {trace.outcome or 'running':<8} service {trace.service_time:8.3f}s  elapsed {trace.elapsed:8.3f}s"
+                for trace in list(tracer.recent)[-15:]
+            ) or 'No finished jobs yet.'
+        elif args[0].lower() == 'stats':
+            stats = tracer.percentiles()
+            text = f"{'stage':<12} {'count':>5} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10}\n" + '\n'.join(
+                f"{stage:<12} {values['count']:>5} {values['p50'] * 1000:>10.1f} {values['p90'] * 1000:>10.1f} {values['p99'] * 1000:>10.1f}"
+                for stage, values in sorted(stats.items())
+            )
+        else:
+            trace = tracer.find(args[0])
+            if trace is None:
+                await message.channel.send(f'No trace for job `{args[0]}`.')
+                return
+            text = tracer.waterfall(trace)
+
+        if len(text) > 1900:
+            await message.channel.send(file=discord.File(io.BytesIO(text.encode('utf-8')), filename='trace.txt'))
+        else:
+            await message.channel.send(f'```\n{text}```')
+
+    async def profile(message, args):
+        async def __wrong_selection():
+            await message.channel.send('```'
+                                       f'profile cpu [seconds] - Sample all stacks for up to {profiling.MAX_CPU_DURATION}s (collapsed stacks)\n'
+                                       f'profile mem [seconds] - Trace allocations for up to {profiling.MAX_MEMORY_DURATION}s (top growth). Slows allocations while it runs.\n'
+                                       '```')
+
+        if not args or args[0].lower() not in ('cpu', 'mem'):
+            await __wrong_selection()
+            return
+        try:
+            duration = float(args[1]) if len(args) > 1 else 10
+        except ValueError:
+            await __wrong_selection()
+            return
+
+        await message.channel.send(f'Profiling {args[0].lower()} for {duration:.0f}s (capped)...')
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        try:
+            if args[0].lower() == 'cpu':
+                collapsed, summary = await profiler.cpu(duration)
+                await message.channel.send(content=f'```\n{summary[:1900]}```', file=discord.File(io.BytesIO(collapsed.encode('utf-8')), filename=f'cpu-{stamp}.collapsed'))
+            else:
+                report = await profiler.memory(duration)
+                await message.channel.send(file=discord.File(io.BytesIO(report.encode('utf-8')), filename=f'memory-{stamp}.txt'))
+        except profiling.ProfilerBusy as e:
+            await message.channel.send(str(e))
+
     async def shutdown(message):
         global shutdown
         _message = 'Engine powering down...'
@@ -599,14 +1557,31 @@ class Owner():
             await message.channel.send(_message)
         except:
             await owner.send(_message)
+        drain.draining = True
+
+        if drain.active:
+            program_logger.info(f'Waiting up to {SHUTDOWN_DRAIN_TIMEOUT}s for {drain.active} in-flight jobs...')
+            if not await drain.wait(SHUTDOWN_DRAIN_TIMEOUT):
+                program_logger.warning(f'Drain deadline reached, abandoning {drain.active} in-flight jobs.')
+
         await bot.change_presence(status=discord.Status.invisible)
         shutdown = True
 
-        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
-        [task.cancel() for task in tasks]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        program_logger.info(f'Final metrics: {json.dumps(Functions.collect_metrics())}')
+        if bot.stats is not None:
+            bot.stats.stop_stats_update()
+
+        # Only the abandoned jobs are cancelled, while the API session and the journal are still open (see run_job).
+        # Every other task, including the one running the client, ends with bot.close().
+        await drain.abandon()
+
+        await Hercules.close()
+        job_store.compact(JOB_TOKEN_TTL)
+        job_store.close()
 
-        bot.stats.stop_stats_update()
+        await asyncio.to_thread(queue_logging.flush)
+        for handler in logging.getLogger().handlers:
+            handler.flush()
 
         await bot.close()
 
@@ -626,37 +1601,9 @@ async def cmd_ping(interaction: discord.Interaction):
 @tree.command(name='botinfo', description='Get information about the bot.')
 @discord.app_commands.checks.cooldown(1, 60, key=lambda i: (i.user.id))
 async def cmd_botinfo(interaction: discord.Interaction):
-    member_count = sum(guild.member_count for guild in bot.guilds)
-
-    embed = discord.Embed(
-        title=f"Information about {bot.user.name}",
-        color=discord.Color.blue()
-    )
-    embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else '')
-
-    embed.add_field(name="Created at", value=bot.user.created_at.strftime("%d.%m.%Y, %H:%M:%S"), inline=True)
-    embed.add_field(name="Bot-Version", value=BOT_VERSION, inline=True)
-    embed.add_field(name="Uptime", value=str(datetime.timedelta(seconds=int((datetime.datetime.now(datetime.UTC) - start_time).total_seconds()))), inline=True)
-
-    embed.add_field(name="Bot-Owner", value=f"<@!{OWNERID}>", inline=True)
-    embed.add_field(name="\u200b", value="\u200b", inline=True)
-    embed.add_field(name="\u200b", value="\u200b", inline=True)
-
-    embed.add_field(name="Server", value=f"{len(bot.guilds)}", inline=True)
-    embed.add_field(name="Member count", value=str(member_count), inline=True)
-    embed.add_field(name="\u200b", value="\u200b", inline=True)
-
-    embed.add_field(name="Shards", value=f"{bot.shard_count}", inline=True)
-    embed.add_field(name="Shard ID", value=f"{interaction.guild.shard_id if interaction.guild else 'N/A'}", inline=True)
-    embed.add_field(name="\u200b", value="\u200b", inline=True)
-
-    embed.add_field(name="Python-Version", value=f"{platform.python_version()}", inline=True)
-    embed.add_field(name="discord.py-Version", value=f"{discord.__version__}", inline=True)
-    embed.add_field(name="Sentry-Version", value=f"{sentry_sdk.consts.VERSION}", inline=True)
-
-    embed.add_field(name="Repo", value=f"[GitHub](https://github.com/Serpensin/DiscordBots-Hercules)", inline=True)
-    embed.add_field(name="Invite", value=f"[Invite me](https://discord.com/oauth2/authorize?client_id={bot.user.id})", inline=True)
-    embed.add_field(name="\u200b", value="\u200b", inline=True)
+    embed = Functions.get_botinfo_embed()
+    embed.set_field_at(2, name="Uptime", value=str(datetime.timedelta(seconds=int((datetime.datetime.now(datetime.UTC) - start_time).total_seconds()))), inline=True)
+    embed.set_field_at(10, name="Shard ID", value=f"{interaction.guild.shard_id if interaction.guild else 'N/A'}", inline=True)
 
     if interaction.user.id == int(OWNERID):
         process = psutil.Process(os.getpid())
@@ -667,6 +1614,7 @@ async def cmd_botinfo(interaction: discord.Interaction):
         embed.add_field(name="CPU", value=f"{cpu_usage}%", inline=True)
         embed.add_field(name="RAM", value=f"{ram_usage}%", inline=True)
         embed.add_field(name="RAM", value=f"{ram_real} MB", inline=True)
+        embed.add_field(name="Shard latency", value=Functions.shard_health_text(), inline=False)
 
     await interaction.response.send_message(embed=embed)
 
@@ -676,9 +1624,9 @@ async def cmd_botinfo(interaction: discord.Interaction):
 async def cmd_help(interaction: discord.Interaction):
     commands_help = (
         "**/obfuscate_url [url]**:\nSubmit a URL (e.g. from pastebin) containing a Lua file. Hercules will process and obfuscate it.\n\n"
-        "**/obfuscate_file [file]**:\nUpload a `.lua` file along with this command. Hercules will add it to the queue and notify you once it's done.\n\n"
+        "**/obfuscate_file [file]**:\nUpload a `.lua` file, or a `.zip` archive of `.lua` files, along with this command. Hercules will add it to the queue and notify you once it's done.\n\n"
         "**/check_url [url]**:\nCheck if a URL (e.g. from pastebin) contains valid Lua syntax.\n\n"
-        "**/check_file [file]**:\nUpload a `.lua` file along with this command to check if it contains valid Lua syntax.\n\n"
+        "**/check_file [file]**:\nUpload a `.lua` file, or a `.zip` archive of `.lua` files, along with this command to check if it contains valid Lua syntax.\n\n"
     )
 
     methods_explanations = "**Obfuscation Methods:**\n\n"
@@ -713,30 +1661,20 @@ async def cmd_support(interaction: discord.Interaction):
 
 
 class ModeSelectionView(discord.ui.View):
-    def __init__(self, preset_methods: list = None):
+    def __init__(self, job: jobs.Job, selected_bits: int):
         super().__init__(timeout=30)
+        self.job = job
         self.timedout = False
         self.buttons_per_row = 5
-        self.create_buttons(preset_methods)
+        self.create_buttons(selected_bits)
 
     def toggle_bit(self, bit_position):
         self.selected_bits ^= (1 << bit_position)
 
-    def create_buttons(self, preset_methods: list = None):
-        if preset_methods is not None:
-            self.selected_bits = sum(
-                (1 << method['bitkey'])
-                for method in Hercules.methods
-                if method['key'] in preset_methods and method['enabled']
-            )
-        else:
-            self.selected_bits = sum(
-                (1 << method['bitkey'])
-                for method in Hercules.methods
-                if method['enabled']
-            )
+    def create_buttons(self, selected_bits: int):
+        self.selected_bits = selected_bits
 
-        for idx, method in enumerate(Hercules.methods):
+        for idx, method in enumerate(Hercules.catalog.methods):
             method_name = method['name']
             bit_position = method['bitkey']
             is_selected = self.selected_bits & (1 << bit_position) != 0
@@ -772,7 +1710,8 @@ class ModeSelectionView(discord.ui.View):
                 self.label += ' (Selected)'
                 self.style = discord.ButtonStyle.success
 
-            await interaction.response.edit_message(view=view)
+            content = await asyncio.to_thread(Functions.selection_content, interaction, view.job, view.selected_bits)
+            await interaction.response.edit_message(content=content, view=view)
 
     @discord.ui.button(label='Submit', style=discord.ButtonStyle.danger, row=0)
     async def submit_button(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -783,6 +1722,71 @@ class ModeSelectionView(discord.ui.View):
             self.stop()
 
 
+class MethodToggle(discord.ui.DynamicItem[discord.ui.Button], template=r'hercules:toggle:(?P<job>[0-9a-f]+):(?P<bits>[0-9a-f]+):(?P<bit>[0-9]+)'):
+    def __init__(self, job_id: str, selected_bits: int, bit_position: int, label: str = '', disabled: bool = False, row: int = None):
+        selected = selected_bits & (1 << bit_position) != 0
+        super().__init__(
+            discord.ui.Button(
+                label=label + (' (Selected)' if selected else ''),
+                style=discord.ButtonStyle.success if selected else discord.ButtonStyle.primary,
+                custom_id=f'hercules:toggle:{job_id}:{selected_bits:x}:{bit_position}',
+                disabled=disabled,
+                row=row
+            )
+        )
+        self.job_id = job_id
+        self.selected_bits = selected_bits
+        self.bit_position = bit_position
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match: re.Match[str]):
+        return cls(match['job'], int(match['bits'], 16), int(match['bit']))
+
+    async def callback(self, interaction: discord.Interaction):
+        selected_bits = self.selected_bits ^ (1 << self.bit_position)
+        job = await asyncio.to_thread(job_store.load, self.job_id)
+        content = await asyncio.to_thread(Functions.selection_content, interaction, job, selected_bits) if job is not None else discord.utils.MISSING
+        await interaction.response.edit_message(content=content, view=Functions.method_view(self.job_id, selected_bits))
+
+
+class MethodSubmit(discord.ui.DynamicItem[discord.ui.Button], template=r'hercules:submit:(?P<job>[0-9a-f]+):(?P<bits>[0-9a-f]+)'):
+    def __init__(self, job_id: str, selected_bits: int):
+        super().__init__(
+            discord.ui.Button(
+                label='Submit',
+                style=discord.ButtonStyle.danger,
+                custom_id=f'hercules:submit:{job_id}:{selected_bits:x}',
+                row=0
+            )
+        )
+        self.job_id = job_id
+        self.selected_bits = selected_bits
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match: re.Match[str]):
+        return cls(match['job'], int(match['bits'], 16))
+
+    async def callback(self, interaction: discord.Interaction):
+        selected_bits = self.selected_bits & Hercules.catalog.enabled_bits
+        if selected_bits == 0:
+            await interaction.response.send_message("You must select at least one obfuscation method!", ephemeral=True)
+            return
+        if drain.draining:
+            await interaction.response.send_message("Hercules is restarting right now. Your selection is kept, press Submit again in a minute.", ephemeral=True)
+            return
+        job = job_store.load(self.job_id)
+        if job is None or job.state != 'selecting':
+            await interaction.response.edit_message(content="This selection has expired. Please run the command again.", view=None)
+            return
+        if job.user_id != interaction.user.id:
+            await interaction.response.send_message("This is not your job.", ephemeral=True)
+            return
+        tracer.get(job.job_id).end('select')
+        job_store.submit(job, selected_bits, interaction.application_id, interaction.token)
+        await interaction.response.edit_message(view=None)
+        await Functions.run_job(interaction, job)
+
+
 class AskSendDebug(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=20)
@@ -839,8 +1843,20 @@ class AskSendDebug(discord.ui.View):
 )
 async def cmd_obfuscate_url(interaction: discord.Interaction, url: str, optional_preset: str = None):
     await interaction.response.defer(ephemeral=True)
-    valid, conout = await Functions.is_valid_url_and_lua_syntax(url)
+    if not await Functions.check_accepting(interaction):
+        return
+    if not await Functions.check_rate_limit(interaction):
+        return
+    reserved = await Functions.reserve_memory(interaction, 5 * 1024 * 1024 * membudget.VALIDATE_FACTOR)
+    if reserved is None:
+        return
+    trace = tracer.start('url')
+    try:
+        valid, conout = await Functions.is_valid_url_and_lua_syntax(url, trace)
+    finally:
+        await memory_budget.release(reserved)
     if not valid:
+        tracer.finish(trace, 'invalid')
         if len(conout) > 1900:
             with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
                 temp_file.write(conout)
@@ -852,40 +1868,17 @@ async def cmd_obfuscate_url(interaction: discord.Interaction, url: str, optional
             await interaction.edit_original_response(content=f"The URL is not reachable or does not contain valid Lua syntax.:\n```txt\n{conout}```")
         return
     else:
-        original_code = conout
-        preset_methods = await Hercules.get_preset_methods(optional_preset) if optional_preset else None
-        view = ModeSelectionView(preset_methods)
-
-        await interaction.edit_original_response(content=f"Please select the obfuscation methods you want to use for {url}.", view=view)
-
-        await view.wait()
-        selected_bits = view.selected_bits
-
-        file_path = os.path.abspath(f'{BUFFER_FOLDER}{interaction.user.id}_url.lua')
-        with open(file_path, 'w', encoding='utf8') as f:
+        rate_limiter.charge(interaction.user.id, interaction.guild_id, len(conout))
+        job = jobs.Job(job_store.new_id(), interaction.user.id, interaction.guild_id, 'url', url)
+        with open(job_store.input_path(job), 'w', encoding='utf8') as f:
             f.write(conout)
-
-        success, conout = await Hercules.obfuscate(file_path, selected_bits)
-        if not success:
-            view = AskSendDebug()
-
-            with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
-                temp_file.write(conout)
-                temp_file_path = temp_file.name
-
-            message = await interaction.followup.send(f"{interaction.user.mention}\nObfuscation failed. Please try again.\nSend the original file to the owner for debug?", file=discord.File(temp_file_path, filename='Error.txt'), view=view, ephemeral=True)
-            await interaction.delete_original_response()
-            view.message = message
-            view.error_text = conout
-            view.original_code = original_code
-            await view.wait()
-            os.remove(temp_file_path)
-        else:
-            await Functions.send_file(interaction, file_path)
+        job_store.save(job)
+        tracer.bind(trace, job.job_id)
+        await Functions.start_selection(interaction, job, optional_preset, f"Please select the obfuscation methods you want to use for {url}.")
 
 
 @tree.command(name='obfuscate_file', description='Upload a Lua file.')
-@discord.app_commands.describe(file='File to be obfuscated.', optional_preset='Optional presets that can be used.')
+@discord.app_commands.describe(file='File to be obfuscated. (.lua or .zip)', optional_preset='Optional presets that can be used.')
 @discord.app_commands.choices(
     optional_preset=[
         discord.app_commands.Choice(name='Light obfuscation for basic protection', value='light'),
@@ -895,61 +1888,35 @@ async def cmd_obfuscate_url(interaction: discord.Interaction, url: str, optional
 )
 async def cmd_obfuscate_file(interaction: discord.Interaction, file: discord.Attachment, optional_preset: str = None):
     await interaction.response.defer(ephemeral=True)
-    if not file.filename.endswith('.lua'):
-        await interaction.edit_original_response(content="Please upload a `.lua` file.")
+    if not await Functions.check_accepting(interaction):
         return
-    if file.size > 1024 * 1024 * 5:
+    if not file.filename.endswith(('.lua', '.zip')):
+        await interaction.edit_original_response(content="Please upload a `.lua` or `.zip` file.")
+        return
+    if file.filename.endswith('.lua') and file.size > 1024 * 1024 * 5:
         await interaction.edit_original_response(content="The file is too big. Please upload a file smaller than 5 MB.")
         return
+    if not await Functions.check_rate_limit(interaction, file.size):
+        return
+    if file.filename.endswith('.zip'):
+        await Functions.obfuscate_archive(interaction, file, optional_preset)
+        return
 
-    file_path = os.path.abspath(f'{BUFFER_FOLDER}{interaction.user.id}_file.lua')
-    with open(file_path, 'wb') as f:
-        f.write(await file.read())
-
-    def detect_bom_encoding(file_path):
-        with open(file_path, 'rb') as f:
-            raw = f.read(4)
-        if raw.startswith(b'\xef\xbb\xbf'):
-            return 'utf-8-sig'
-        elif raw.startswith(b'\xff\xfe'):
-            return 'utf-16-le'
-        elif raw.startswith(b'\xfe\xff'):
-            return 'utf-16-be'
-        elif raw.startswith(b'\xff\xfe\x00\x00'):
-            return 'utf-32-le'
-        elif raw.startswith(b'\x00\x00\xfe\xff'):
-            return 'utf-32-be'
-        return None
-
-    encoding = detect_bom_encoding(file_path)
-    if encoding:
-        with open(file_path, 'r', encoding=encoding) as f:
-            lua_code = f.read()
-        with open(file_path, 'w', encoding='utf8') as f:
-            f.write(lua_code)
-    else:
-        try:
-            with open(file_path, 'r', encoding='utf8') as f:
-                lua_code = f.read()
-        except UnicodeDecodeError:
-            for fallback_encoding in ['cp1252', 'latin-1']:
-                try:
-                    with open(file_path, 'r', encoding=fallback_encoding) as f:
-                        lua_code = f.read()
-                    with open(file_path, 'w', encoding='utf8') as f:
-                        f.write(lua_code)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                with open(file_path, 'rb') as f:
-                    raw = f.read()
-                lua_code = raw.decode('utf-8', errors='replace')
-                with open(file_path, 'w', encoding='utf8') as f:
-                    f.write(lua_code)
-
-    isValid, conout = await Hercules.isValidLUASyntax(lua_code)
+    reserved = await Functions.reserve_memory(interaction, file.size * membudget.VALIDATE_FACTOR)
+    if reserved is None:
+        return
+    trace = tracer.start('file')
+    try:
+        with trace.span('download'):
+            raw = await file.read()
+        with trace.span('decode'):
+            lua_code = Functions.decode_lua(raw)
+
+        isValid, conout = await Functions.validate_lua(lua_code, trace)
+    finally:
+        await memory_budget.release(reserved)
     if not isValid:
+        tracer.finish(trace, 'invalid')
         if len(conout) > 1900:
             with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
                 temp_file.write(conout)
@@ -959,32 +1926,13 @@ async def cmd_obfuscate_file(interaction: discord.Interaction, file: discord.Att
             os.remove(temp_file_path)
         else:
             await interaction.edit_original_response(content=f"The uploaded file does not contain valid Lua syntax.:\n```txt\n{conout}```")
-        os.remove(file_path)
     else:
-        preset_methods = await Hercules.get_preset_methods(optional_preset) if optional_preset else None
-        view = ModeSelectionView(preset_methods)
-        await interaction.edit_original_response(content=f"Please select the obfuscation methods you want to use for {file.filename}.", view=view)
-        await view.wait()
-
-        selected_bits = view.selected_bits
-
-        success, conout = await Hercules.obfuscate(file_path, selected_bits)
-        if not success:
-            view = AskSendDebug()
-
-            with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
-                temp_file.write(conout)
-                temp_file_path = temp_file.name
-
-            message = await interaction.followup.send(f"{interaction.user.mention}\nObfuscation failed. Please try again.\nSend the original file to the owner for debug?", file=discord.File(temp_file_path, filename='Error.txt'), view=view, ephemeral=True)
-            await interaction.delete_original_response()
-            view.message = message
-            view.error_text = conout
-            view.original_code = lua_code
-            await view.wait()
-            os.remove(temp_file_path)
-        else:
-            await Functions.send_file(interaction, file_path)
+        job = jobs.Job(job_store.new_id(), interaction.user.id, interaction.guild_id, 'file', file.filename)
+        with open(job_store.input_path(job), 'w', encoding='utf8') as f:
+            f.write(lua_code)
+        job_store.save(job)
+        tracer.bind(trace, job.job_id)
+        await Functions.start_selection(interaction, job, optional_preset, f"Please select the obfuscation methods you want to use for {file.filename}.")
 
 
 @tree.command(name='check_url', description='Check if the URL is reachable and contains valid Lua syntax.')
@@ -992,7 +1940,13 @@ async def cmd_obfuscate_file(interaction: discord.Interaction, file: discord.Att
 @discord.app_commands.describe(url='The URL to check.')
 async def cmd_check_url(interaction: discord.Interaction, url: str):
     await interaction.response.defer(ephemeral=True)
-    valid, conout = await Functions.is_valid_url_and_lua_syntax(url)
+    reserved = await Functions.reserve_memory(interaction, 5 * 1024 * 1024 * membudget.VALIDATE_FACTOR)
+    if reserved is None:
+        return
+    try:
+        valid, conout = await Functions.is_valid_url_and_lua_syntax(url)
+    finally:
+        await memory_budget.release(reserved)
     if not valid:
         with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
             temp_file.write(conout)
@@ -1005,24 +1959,33 @@ async def cmd_check_url(interaction: discord.Interaction, url: str):
 
 @tree.command(name='check_file', description='Check if the uploaded file contains valid Lua syntax.')
 @discord.app_commands.checks.cooldown(2, 60, key=lambda i: (i.user.id))
-@discord.app_commands.describe(file='The file to check.')
+@discord.app_commands.describe(file='The file to check. (.lua or .zip)')
 async def cmd_check_file(interaction: discord.Interaction, file: discord.Attachment):
     await interaction.response.defer(ephemeral=True)
+    if file.filename.endswith('.zip'):
+        await Functions.check_archive(interaction, file)
+        return
     if not file.filename.endswith('.lua'):
-        await interaction.edit_original_response(content="Please upload a `.lua` file.")
+        await interaction.edit_original_response(content="Please upload a `.lua` or `.zip` file.")
         return
     if file.size > 1024 * 1024 * 5:
         await interaction.edit_original_response(content="The file is too big. Please upload a file smaller than 5 MB.")
         return
 
+    reserved = await Functions.reserve_memory(interaction, file.size * membudget.VALIDATE_FACTOR)
+    if reserved is None:
+        return
     file_path = os.path.abspath(f'{BUFFER_FOLDER}{interaction.user.id}_file.lua')
-    with open(file_path, 'wb') as f:
-        f.write(await file.read())
+    try:
+        with open(file_path, 'wb') as f:
+            f.write(await file.read())
 
-    with open(file_path, 'r', encoding='utf8') as f:
-        lua_code = f.read()
+        with open(file_path, 'r', encoding='utf8') as f:
+            lua_code = f.read()
 
-    isValid, conout = await Hercules.isValidLUASyntax(lua_code)
+        isValid, conout = await Functions.validate_lua(lua_code)
+    finally:
+        await memory_budget.release(reserved)
     if not isValid:
         with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, encoding='utf-8', mode='w') as temp_file:
             temp_file.write(conout)
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Optional
+
+
+# Rough number of copies of the input a job holds at once.
+# Validation: attachment bytes, decoded str, JSON body and its compressed form.
+VALIDATE_FACTOR = 4
+# Obfuscation and delivery: the above plus the response, which is often several times larger than the input.
+OBFUSCATE_FACTOR = 10
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class MemoryBudget:
+    """Process-wide estimate of payload bytes held by running jobs.
+
+    A job reserves its estimate before it loads the payload. If the budget is exhausted it waits for
+    other jobs to release theirs, up to `timeout` seconds, and is rejected after that.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, nbytes: int, timeout: Optional[float] = None) -> int:
+        """Reserve `nbytes` (capped at the whole budget) and return the amount to release later."""
+        nbytes = min(max(int(nbytes), 0), self.limit)
+        async with self._condition:
+            if self.in_flight + nbytes > self.limit:
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self.in_flight + nbytes <= self.limit), timeout)
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise BudgetExceeded(f"Memory budget exhausted ({self.in_flight} of {self.limit} bytes in flight).")
+                finally:
+                    self.waiting -= 1
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+            self.admitted += 1
+        return nbytes
+
+    async def release(self, nbytes: int):
+        async with self._condition:
+            self.in_flight -= nbytes
+            self._condition.notify_all()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "peak": self.peak,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
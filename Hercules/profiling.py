@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Tuple
+
+
+MAX_CPU_DURATION = 60
+MAX_MEMORY_DURATION = 30
+MIN_INTERVAL = 0.005
+MAX_INTERVAL = 0.5
+# Share of wall time the sampler may spend walking stacks before it backs off.
+MAX_OVERHEAD = 0.02
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name='profiler-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.cost = 0.0
+        self.elapsed = 0.0
+        self.backoffs = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        started = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            sample_start = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            self.cost += time.perf_counter() - sample_start
+            self.elapsed = time.perf_counter() - started
+            if self.cost / self.elapsed > MAX_OVERHEAD and self.interval < MAX_INTERVAL:
+                self.interval = min(MAX_INTERVAL, self.interval * 2)
+                self.backoffs += 1
+
+
+class Profiler:
+    """Bounded CPU (stack sampling) and memory (tracemalloc) profiles of the running process, one at a time."""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def cpu(self, duration: float, interval: float = 0.01) -> Tuple[str, str]:
+        """Sample every thread for `duration` seconds. Returns collapsed stacks (flamegraph.pl format) and a summary."""
+        if self._lock.locked():
+            raise ProfilerBusy("A profile is already running.")
+        duration = max(1.0, min(float(duration), MAX_CPU_DURATION))
+        async with self._lock:
+            sampler = _Sampler(max(MIN_INTERVAL, interval))
+            sampler.start()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                await asyncio.to_thread(sampler.stop)
+
+        collapsed = '\n'.join(f'{stack} {count}' for stack, count in sampler.stacks.most_common())
+        leaves = collections.Counter()
+        for stack, count in sampler.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(sampler.stacks.values()) or 1
+        overhead = sampler.cost / sampler.elapsed * 100 if sampler.elapsed else 0.0
+        summary = [f'{sampler.samples} samples in {duration:.0f}s, final interval {sampler.interval * 1000:.0f}ms, '
+                   f'overhead {overhead:.2f}%{f" (backed off {sampler.backoffs}x)" if sampler.backoffs else ""}']
+        summary += [f'{count / total * 100:5.1f}% {leaf}' for leaf, count in leaves.most_common(10)]
+        return collapsed, '\n'.join(summary)
+
+    async def memory(self, duration: float, top: int = 25, frames: int = 10) -> str:
+        """Trace allocations for `duration` seconds and return the top-N growth, grouped by traceback."""
+        if self._lock.locked():
+            raise ProfilerBusy("A profile is already running.")
+        if tracemalloc.is_tracing():
+            raise ProfilerBusy("tracemalloc is already tracing in this process.")
+        duration = max(1.0, min(float(duration), MAX_MEMORY_DURATION))
+        async with self._lock:
+            tracemalloc.start(frames)
+            try:
+                before = tracemalloc.take_snapshot()
+                await asyncio.sleep(duration)
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                overhead = tracemalloc.get_tracemalloc_memory()
+            finally:
+                tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>')]
+        diff = await asyncio.to_thread(lambda: after.filter_traces(filters).compare_to(before.filter_traces(filters), 'traceback'))
+        lines = [f'Allocation growth over {duration:.0f}s: traced {current / 1024 / 1024:.1f} MiB now, '
+                 f'peak {peak / 1024 / 1024:.1f} MiB, tracemalloc itself {overhead / 1024 / 1024:.1f} MiB', '']
+        for index, stat in enumerate(diff[:top], 1):
+            lines.append(f'#{index}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), {stat.size / 1024:.1f} KiB total')
+            lines.extend(f'    {line}' for line in stat.traceback.format(most_recent_first=True))
+        return '\n'.join(lines)
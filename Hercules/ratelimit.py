@@ -0,0 +1,135 @@
+import time
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class BucketConfig:
+    """`capacity` tokens, refilled at `rate` tokens per second."""
+
+    __slots__ = ('capacity', 'rate')
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+
+    def to_dict(self) -> dict:
+        return {"capacity": self.capacity, "rate": self.rate}
+
+
+class RateLimiter:
+    """Per-user, per-guild and global token buckets for the expensive obfuscation commands.
+
+    A request costs `base_cost` plus one token per started `bytes_per_token` of payload. It is only
+    admitted if every bucket it touches can pay, so a rejected request never consumes anything.
+    Buckets that have been idle long enough to be full again are dropped by `evict_idle`.
+    """
+
+    SCOPES = ('user', 'guild', 'global')
+
+    def __init__(self, user: BucketConfig, guild: BucketConfig, glob: BucketConfig,
+                 base_cost: float = 1, bytes_per_token: int = 1024 * 1024):
+        self.configs: Dict[str, BucketConfig] = {'user': user, 'guild': guild, 'global': glob}
+        self.base_cost = base_cost
+        self.bytes_per_token = bytes_per_token
+        self._buckets: Dict[Tuple[str, int], TokenBucket] = {}
+        self.rejected = 0
+        self.admitted = 0
+
+    def cost(self, size: int) -> float:
+        return self.base_cost + -(-max(size, 0) // self.bytes_per_token)
+
+    def _refilled(self, scope: str, key: int, now: float) -> TokenBucket:
+        config = self.configs[scope]
+        bucket = self._buckets.get((scope, key))
+        if bucket is None:
+            bucket = TokenBucket(config.capacity, now)
+            self._buckets[(scope, key)] = bucket
+        else:
+            bucket.tokens = min(config.capacity, bucket.tokens + (now - bucket.updated) * config.rate)
+            bucket.updated = now
+        return bucket
+
+    def acquire(self, user_id: int, guild_id: Optional[int], size: int = 0) -> float:
+        """Take tokens for one request. Returns 0 on success, otherwise the seconds until it would succeed."""
+        now = time.monotonic()
+        cost = self.cost(size)
+        keys = [('user', user_id), ('global', 0)]
+        if guild_id is not None:
+            keys.append(('guild', guild_id))
+
+        retry_after = 0.0
+        buckets = []
+        for scope, key in keys:
+            config = self.configs[scope]
+            if cost > config.capacity:
+                # A request larger than the bucket can ever hold is charged a full bucket instead.
+                needed = config.capacity
+            else:
+                needed = cost
+            bucket = self._refilled(scope, key, now)
+            if bucket.tokens < needed:
+                retry_after = max(retry_after, (needed - bucket.tokens) / config.rate if config.rate > 0 else float('inf'))
+            buckets.append((bucket, needed))
+
+        if retry_after > 0:
+            self.rejected += 1
+            return retry_after
+        for bucket, needed in buckets:
+            bucket.tokens -= needed
+        self.admitted += 1
+        return 0.0
+
+    def charge(self, user_id: int, guild_id: Optional[int], size: int):
+        """Charge the size-dependent part of the cost after the fact. Buckets may go into debt."""
+        extra = self.cost(size) - self.base_cost
+        if extra <= 0:
+            return
+        now = time.monotonic()
+        keys = [('user', user_id), ('global', 0)]
+        if guild_id is not None:
+            keys.append(('guild', guild_id))
+        for scope, key in keys:
+            self._refilled(scope, key, now).tokens -= min(extra, self.configs[scope].capacity)
+
+    def configure(self, scope: str, capacity: float, rate: float):
+        if scope not in self.configs:
+            raise ValueError(f"Unknown scope: {scope}")
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("Capacity and rate must be positive.")
+        self.configs[scope] = BucketConfig(capacity, rate)
+        for (bucket_scope, _), bucket in self._buckets.items():
+            if bucket_scope == scope:
+                bucket.tokens = min(bucket.tokens, capacity)
+
+    def evict_idle(self) -> int:
+        now = time.monotonic()
+        stale = [
+            key for key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * self.configs[key[0]].rate >= self.configs[key[0]].capacity
+        ]
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        scopes = {}
+        for scope in self.SCOPES:
+            config = self.configs[scope]
+            levels = [
+                min(config.capacity, bucket.tokens + (now - bucket.updated) * config.rate)
+                for (bucket_scope, _), bucket in self._buckets.items() if bucket_scope == scope
+            ]
+            scopes[scope] = {
+                **config.to_dict(),
+                "buckets": len(levels),
+                "min_tokens": round(min(levels), 2) if levels else config.capacity,
+            }
+        return {"scopes": scopes, "admitted": self.admitted, "rejected": self.rejected, "base_cost": self.base_cost, "bytes_per_token": self.bytes_per_token}
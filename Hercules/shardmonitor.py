@@ -0,0 +1,119 @@
+import collections
+import math
+import statistics
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class ShardHistory:
+    def __init__(self, size: int, event_size: int):
+        self.latencies: collections.deque = collections.deque(maxlen=size)
+        self.events: collections.deque = collections.deque(maxlen=event_size)
+        self.reconnects = 0
+        self.last_remediation = 0.0
+        self.session_start = 0.0
+        self.connected = True
+
+    @property
+    def last(self) -> Optional[float]:
+        return self.latencies[-1][1] if self.latencies else None
+
+    def summary(self) -> dict:
+        finite = sorted(latency for _, latency in self.latencies if math.isfinite(latency))
+        return {
+            "last": to_ms(self.last),
+            "p50": to_ms(finite[len(finite) // 2]) if finite else None,
+            "max": to_ms(finite[-1]) if finite else None,
+            "samples": len(self.latencies),
+            "reconnects": self.reconnects,
+            "connected": self.connected,
+            "last_event": self.events[-1][1] if self.events else None,
+        }
+
+
+def to_ms(latency: Optional[float]) -> Optional[float]:
+    return round(latency * 1000, 2) if latency is not None and math.isfinite(latency) else None
+
+
+class ShardMonitor:
+    """Ring buffers of heartbeat latency and connection events per shard.
+
+    A shard is an outlier when its last `sustain` samples are all above `factor` x the median of the other
+    connected shards (and at least `min_gap` seconds above it), or have no heartbeat acknowledgement at all.
+    In cluster mode the other workers' latest latencies are passed in as `remote`. The median needs `min_fleet`
+    shards; with fewer, only missing acknowledgements and latencies above `ceiling` count. A shard is remediated at
+    most once per `cooldown` seconds.
+    """
+
+    def __init__(self, size: int = 120, event_size: int = 50, sustain: int = 4, factor: float = 3.0,
+                 min_gap: float = 0.25, ceiling: float = 10.0, min_fleet: int = 3, cooldown: float = 600):
+        self.size = size
+        self.event_size = event_size
+        self.sustain = sustain
+        self.factor = factor
+        self.min_gap = min_gap
+        self.ceiling = ceiling
+        self.min_fleet = min_fleet
+        self.cooldown = cooldown
+        self.shards: Dict[int, ShardHistory] = {}
+
+    def _history(self, shard_id: int) -> ShardHistory:
+        if shard_id not in self.shards:
+            self.shards[shard_id] = ShardHistory(self.size, self.event_size)
+        return self.shards[shard_id]
+
+    def record_latency(self, shard_id: int, latency: float):
+        self._history(shard_id).latencies.append((time.time(), latency))
+
+    def record_event(self, shard_id: int, event: str):
+        history = self._history(shard_id)
+        history.events.append((time.time(), event))
+        if event == 'disconnect':
+            history.reconnects += 1
+            history.connected = False
+        if event in ('connect', 'ready', 'resumed'):
+            # Samples from before the reconnect say nothing about the new session.
+            history.session_start = time.time()
+            history.connected = True
+
+    def fleet_median(self, exclude: Optional[int] = None, remote: Iterable[float] = ()) -> Optional[float]:
+        """Median of the latest latency of every connected shard but `exclude`, plus the `remote` ones."""
+        latest = [
+            history.last for shard_id, history in self.shards.items()
+            if shard_id != exclude and history.connected and history.last is not None and math.isfinite(history.last)
+        ]
+        latest += [latency for latency in remote if math.isfinite(latency)]
+        if len(latest) < self.min_fleet:
+            return None
+        return statistics.median(latest)
+
+    def outliers(self, remote: Iterable[float] = ()) -> List[int]:
+        """Shards to reconnect now. Marks them as remediated."""
+        remote = list(remote)
+        now = time.time()
+        found = []
+        for shard_id, history in self.shards.items():
+            if not history.connected or now - history.last_remediation < self.cooldown:
+                continue
+            median = self.fleet_median(shard_id, remote)
+            threshold = max(median * self.factor, median + self.min_gap) if median is not None else self.ceiling
+            recent = [latency for at, latency in list(history.latencies)[-self.sustain:] if at >= history.session_start]
+            if len(recent) == self.sustain and all(not math.isfinite(latency) or latency > threshold for latency in recent):
+                history.last_remediation = now
+                history.events.append((now, 'remediated'))
+                found.append(shard_id)
+        return found
+
+    def summary(self) -> Dict[str, dict]:
+        return {str(shard_id): history.summary() for shard_id, history in sorted(self.shards.items())}
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Summary plus the full ring buffers, for the health server."""
+        return {
+            str(shard_id): {
+                **history.summary(),
+                "latencies": [[round(at), to_ms(latency)] for at, latency in history.latencies],
+                "events": [[round(at), event] for at, event in history.events],
+            }
+            for shard_id, history in sorted(self.shards.items())
+        }
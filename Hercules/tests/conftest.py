@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot imports its modules flat from the Hercules folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
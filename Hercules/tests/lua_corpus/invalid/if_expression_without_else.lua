@@ -0,0 +1 @@
+local v = if x then 1
@@ -0,0 +1 @@
+local t = {1, 2]
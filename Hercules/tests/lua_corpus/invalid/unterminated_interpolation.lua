@@ -0,0 +1 @@
+print(`unterminated {1}
@@ -0,0 +1 @@
+local s = [[ never closed
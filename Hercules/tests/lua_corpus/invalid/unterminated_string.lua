@@ -0,0 +1,2 @@
+local s = "never closed
+print(s)
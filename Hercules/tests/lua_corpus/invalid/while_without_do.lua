@@ -0,0 +1,3 @@
+while true
+  print(1)
+end
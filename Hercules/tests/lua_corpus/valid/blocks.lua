@@ -0,0 +1,27 @@
+local function fib(n)
+    if n < 2 then
+        return n
+    elseif n == 2 then
+        return 1
+    else
+        return fib(n - 1) + fib(n - 2)
+    end
+end
+
+for i = 1, 10 do
+    while false do end
+    repeat
+        local x = i
+    until x > 0
+end
+
+for k, v in pairs({a = 1, ["b"] = 2, [3] = {4, 5}}) do
+    print(k, v)
+end
+
+do
+    local t = setmetatable({}, {__index = function(t, k) return k end})
+    goto_label = t.x
+end
+
+return fib(10)
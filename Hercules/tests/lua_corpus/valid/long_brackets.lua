@@ -0,0 +1,11 @@
+-- Long strings and comments of every level may contain anything but their own closing bracket.
+local a = [[line one
+line two with ]] .. [==[ nested ]] and ]=] inside ]==]
+--[[ block comment with "quotes" and 'end' ]]
+--[==[
+  function never closed (
+]==]
+local b = [=[
+if then end
+]=]
+return a, b
@@ -0,0 +1,13 @@
+--!strict
+local a = true
+local x: Array<number> = {}
+if a then print(1) end
+type Callback = Signal<Player>
+if a then
+    print(x)
+end
+function f(): Promise<nil>
+    if a then return end
+end
+local nested: Map<string, Array<number>>
+if a then print(nested) end
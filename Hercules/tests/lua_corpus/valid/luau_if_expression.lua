@@ -0,0 +1,8 @@
+local x = 5
+local sign = if x > 0 then 1 elseif x < 0 then -1 else 0
+local label = "value: " .. (if x % 2 == 0 then "even" else "odd")
+local t = { if x then "a" else "b", kind = if x > 3 then "big" else "small" }
+local function pick(v) return if v then v else nil end
+if sign == 1 then
+    print(label, t, pick(x))
+end
@@ -0,0 +1,6 @@
+local name = "world"
+local count = 3
+print(`hello {name}!`)
+print(`nested {`inner {count + 1}`} and braces {{}}`)
+print(`escaped \` backtick and \{ brace`)
+print(`{if count > 2 then "many" else "few"} items`)
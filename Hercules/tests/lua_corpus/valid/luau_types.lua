@@ -0,0 +1,18 @@
+--!strict
+type Point = { x: number, y: number }
+export type Callback<T> = (value: T, index: number) -> boolean?
+
+local function map<T, U>(items: { T }, fn: (T) -> U): { U }
+    local out: { U } = {}
+    for i, item in items do
+        out[i] = fn(item)
+    end
+    return out
+end
+
+local p: Point = { x = 1, y = 2 }
+local q = p :: any
+local n: number | string = 1
+n += 2
+n ..= ""
+return map({1, 2, 3}, function(v: number): number return v * 2 end), q
@@ -0,0 +1,7 @@
+local a = 0x1F + 1e10 + 3.14 + .5 + 0x1p4 + 1_000_000
+local b = #"abc" + 2 ^ 3 % 4 // 2
+local c = not (a ~= b) and a >= b or a <= b
+local d = a .. b
+local e = ...
+local f = {...}
+return a, b, c, d, e, f
@@ -0,0 +1,7 @@
+local s = "escaped \" quote and \\ backslash"
+local t = 'single \' quote -- not a comment'
+local u = "line \z
+           continued"
+local v = "\65\066\x41\u{48}"
+local w = "--[[ not a comment ]]"
+print(s, t, u, v, w)
@@ -0,0 +1,2 @@
+local grüße = "héllo wörld ✓"
+print(grüße) -- コメント
@@ -0,0 +1,43 @@
+import glob
+import os
+import time
+
+import pytest
+
+import lua_precheck
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lua_corpus')
+# Generous, the check has to stay far below the round trip to /api/validate.
+MIN_THROUGHPUT = 1024 * 1024
+
+
+def _read(path: str) -> str:
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def _corpus(kind: str) -> list:
+    return sorted(glob.glob(os.path.join(CORPUS, kind, '*.lua')))
+
+
+@pytest.mark.parametrize('path', _corpus('valid'), ids=os.path.basename)
+def test_accepts_valid(path):
+    assert lua_precheck.precheck(_read(path)) == (True, "")
+
+
+@pytest.mark.parametrize('path', _corpus('invalid'), ids=os.path.basename)
+def test_rejects_invalid(path):
+    valid, diagnostic = lua_precheck.precheck(_read(path))
+    assert not valid
+    assert diagnostic.startswith('line ')
+
+
+def test_throughput():
+    chunk = '\n'.join(_read(path) for path in _corpus('valid'))
+    source = '\n'.join(f'do\n{chunk}\nend' for _ in range(max(1, 2 * 1024 * 1024 // len(chunk))))
+    started = time.perf_counter()
+    assert lua_precheck.precheck(source) == (True, "")
+    elapsed = time.perf_counter() - started
+    throughput = len(source) / elapsed
+    assert throughput >= MIN_THROUGHPUT, f"{throughput / 1024 / 1024:.2f} MiB/s"
@@ -0,0 +1,112 @@
+import collections
+import contextlib
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class Trace:
+    """Stage timeline of one job. Offsets are seconds since the trace started.
+    Idle stages (the user picking methods or answering a prompt) do not count towards the service time."""
+
+    def __init__(self, kind: str):
+        self.job_id: Optional[str] = None
+        self.kind = kind
+        self.wall_start = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float, bool]] = []
+        self.outcome: Optional[str] = None
+        self._open: Dict[str, Tuple[float, bool]] = {}
+
+    def begin(self, stage: str, idle: bool = False):
+        self._open[stage] = (time.perf_counter() - self.started, idle)
+
+    def end(self, stage: str):
+        if stage in self._open:
+            start, idle = self._open.pop(stage)
+            self.spans.append((stage, start, time.perf_counter() - self.started, idle))
+
+    @contextlib.contextmanager
+    def span(self, stage: str, idle: bool = False):
+        self.begin(stage, idle)
+        try:
+            yield
+        finally:
+            self.end(stage)
+
+    @property
+    def elapsed(self) -> float:
+        return max((end for _, _, end, _ in self.spans), default=0.0)
+
+    @property
+    def service_time(self) -> float:
+        return self.elapsed - sum(end - start for _, start, end, idle in self.spans if idle)
+
+    def durations(self) -> Dict[str, float]:
+        durations = collections.defaultdict(float)
+        for stage, start, end, _ in self.spans:
+            durations[stage] += end - start
+        return durations
+
+
+class Tracer:
+    """Keeps the traces of running jobs and the last `size` finished ones."""
+
+    def __init__(self, size: int = 200, max_age: int = 3600):
+        self.recent: collections.deque = collections.deque(maxlen=size)
+        self.max_age = max_age
+        self._active: Dict[str, Trace] = {}
+
+    def start(self, kind: str) -> Trace:
+        return Trace(kind)
+
+    def bind(self, trace: Trace, job_id: str):
+        now = time.time()
+        for stale in [key for key, other in self._active.items() if now - other.wall_start > self.max_age]:
+            del self._active[stale]
+        trace.job_id = job_id
+        self._active[job_id] = trace
+
+    def get(self, job_id: str, kind: str = 'resumed') -> Trace:
+        """The trace of a running job; a fresh one if it was started by an earlier process."""
+        trace = self._active.get(job_id)
+        if trace is None:
+            trace = Trace(kind)
+            self.bind(trace, job_id)
+        return trace
+
+    def finish(self, trace: Trace, outcome: str):
+        trace.outcome = outcome
+        for stage in list(trace._open):
+            trace.end(stage)
+        if trace.job_id is not None:
+            self._active.pop(trace.job_id, None)
+        self.recent.append(trace)
+
+    def find(self, job_id: str) -> Optional[Trace]:
+        if job_id in self._active:
+            return self._active[job_id]
+        return next((trace for trace in reversed(self.recent) if trace.job_id == job_id), None)
+
+    def percentiles(self, quantiles: Tuple[int, ...] = (50, 90, 99)) -> Dict[str, dict]:
+        samples = collections.defaultdict(list)
+        for trace in self.recent:
+            for stage, duration in trace.durations().items():
+                samples[stage].append(duration)
+            samples['service'].append(trace.service_time)
+        stats = {}
+        for stage, values in samples.items():
+            values.sort()
+            stats[stage] = {'count': len(values), **{f'p{q}': values[max(0, math.ceil(q / 100 * len(values)) - 1)] for q in quantiles}}
+        return stats
+
+    @staticmethod
+    def waterfall(trace: Trace, width: int = 40) -> str:
+        total = trace.elapsed or 1e-9
+        lines = [f"Job {trace.job_id} ({trace.kind}, {trace.outcome or 'running'}): service {trace.service_time:.3f}s, elapsed {trace.elapsed:.3f}s"]
+        for stage, start, end, idle in sorted(trace.spans, key=lambda span: span[1]):
+            offset = int(start / total * width)
+            length = max(1, int((end - start) / total * width))
+            bar = ' ' * offset + ('.' if idle else '#') * length
+            lines.append(f"{stage:<12} {bar:<{width + 1}} {start:8.3f}s +{end - start:.3f}s{' (idle)' if idle else ''}")
+        return '\n'.join(lines)